@@ -1,6 +1,7 @@
 # core/admin.py
 from django.contrib import admin
-from .models import Referral, Assignment
+from django.utils import timezone
+from .models import Referral, Assignment, OutboundEmail
 
 @admin.register(Referral)
 class ReferralAdmin(admin.ModelAdmin):
@@ -59,3 +60,18 @@ class AssignmentAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related(
             'yellow_member__user', 'sponsored_member__user'
         )
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'kind', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('subject', 'to')
+    readonly_fields = ('attempts', 'claimed_at', 'last_error', 'created_at', 'sent_at')
+    actions = ['requeue']
+
+    @admin.action(description='Requeue selected messages now')
+    def requeue(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(
+            status='queued', attempts=0, next_attempt_at=timezone.now(), last_error=''
+        )
+        self.message_user(request, f'{updated} message(s) requeued.')
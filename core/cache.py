@@ -0,0 +1,294 @@
+# core/cache.py
+"""Two-tier cache backend: a size-bounded, TTL-aware LRU in each process in front
+of a shared tier (Redis when LOCATION is a redis:// URL, otherwise a file-based
+cache directory, so it runs locally without any services).
+
+Cross-process invalidation goes through version keys in the shared tier. Every
+key hashes to one of GENERATION_BUCKETS generation keys; writes replace the
+key's generation token, and each process polls all of them (one get_many) at most every
+GENERATION_CHECK_INTERVAL seconds, dropping local entries whose bucket moved.
+A write in one process is therefore visible in the others within that interval.
+Local copies never outlive LOCAL_TIMEOUT seconds, which also bounds how long a
+copy fetched from the shared tier can outlast the shared entry's own expiry.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TieredCache',
+            'LOCATION': os.environ.get('REDIS_URL', '/var/tmp/wepool_cache'),
+            'OPTIONS': {'LOCAL_MAX_ENTRIES': 1000, 'LOCAL_TIMEOUT': 30},
+        }
+    }
+"""
+import pickle
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.redis import RedisCache
+
+GENERATION_KEY = 'tiered-generation:{}'
+
+_MISSING = object()
+
+def next_generation():
+    """Generation tokens are never reused, so a poll cannot mistake a new generation for an old one"""
+    return uuid.uuid4().hex
+
+# Cache instances are per thread; the local tier is shared by every thread in the process
+_local_stores = {}
+_local_stores_lock = threading.Lock()
+
+class LocalStore:
+    """Process-wide LRU of (expires_at, bucket, pickled value), with hit/miss counters.
+    Values are pickled, as in LocMemCache, so callers never share mutable objects."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generations = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+        # Serializes polls (generations/checked_at); separate from lock so a poll never blocks reads
+        self.sync_lock = threading.Lock()
+        self.counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, _, pickled = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self.entries[key]
+                return _MISSING
+            self.entries.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def set(self, key, bucket, value, timeout):
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.entries[key] = (expires_at, bucket, pickled)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def drop_buckets(self, buckets):
+        with self.lock:
+            stale = [key for key, (_, bucket, _) in self.entries.items() if bucket in buckets]
+            for key in stale:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 30)
+        self.check_interval = options.get('GENERATION_CHECK_INTERVAL', 1.0)
+        self.buckets = options.get('GENERATION_BUCKETS', 32)
+
+        shared_params = {
+            key: value for key, value in params.items()
+            if key in ('TIMEOUT', 'KEY_PREFIX', 'VERSION', 'KEY_FUNCTION')
+        }
+        shared_params['OPTIONS'] = options.get('SHARED_OPTIONS', {})
+        if location.startswith(('redis://', 'rediss://', 'unix://')):
+            self.shared = RedisCache(location, shared_params)
+        else:
+            self.shared = FileBasedCache(location, shared_params)
+
+        store_name = f'{location}:{self.key_prefix}'
+        with _local_stores_lock:
+            if store_name not in _local_stores:
+                _local_stores[store_name] = LocalStore(options.get('LOCAL_MAX_ENTRIES', 1000))
+            self.local = _local_stores[store_name]
+
+    # Generations
+
+    def bucket_of(self, key):
+        return zlib.crc32(key.encode()) % self.buckets
+
+    def generation_keys(self):
+        return [GENERATION_KEY.format(bucket) for bucket in range(self.buckets)]
+
+    def sync_generations(self):
+        """Drop local entries in buckets that another process has written to since the last poll"""
+        if time.monotonic() - self.local.checked_at < self.check_interval:
+            return
+        # Another thread is already polling; it will drop whatever moved
+        if not self.local.sync_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.monotonic()
+            if now - self.local.checked_at < self.check_interval:
+                return
+            self.local.checked_at = now
+            current = self.shared.get_many(self.generation_keys())
+            generations = [current.get(key, 0) for key in self.generation_keys()]
+            previous, self.local.generations = self.local.generations, generations
+            if previous is None:
+                self.local.clear()
+                return
+            changed = {bucket for bucket, (old, new) in enumerate(zip(previous, generations)) if old != new}
+            if changed:
+                self.local.drop_buckets(changed)
+        finally:
+            self.local.sync_lock.release()
+
+    def bump(self, *keys):
+        """Announce writes to keys by giving their buckets a fresh generation token"""
+        self.bump_buckets({self.bucket_of(key) for key in keys})
+
+    def bump_buckets(self, buckets):
+        # The new tokens are deliberately not recorded locally: another process may have
+        # bumped the same buckets since our last poll, and only the poll can tell. Our next
+        # poll drops these buckets here too, at the cost of re-reading our own writes once.
+        self.shared.set_many(
+            {GENERATION_KEY.format(bucket): next_generation() for bucket in buckets},
+            timeout=None
+        )
+
+    def local_timeout_for(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self.sync_generations()
+        value = self.local.get(local_key)
+        if value is not _MISSING:
+            self.local.count('local_hits')
+            return value
+
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self.local.count('misses')
+            return default
+        self.local.count('shared_hits')
+        self.local.set(local_key, self.bucket_of(local_key), value, self.local_timeout)
+        return value
+
+    def get_many(self, keys, version=None):
+        self.sync_generations()
+        found, remote = {}, []
+        for key in keys:
+            value = self.local.get(self.make_and_validate_key(key, version=version))
+            if value is _MISSING:
+                remote.append(key)
+            else:
+                self.local.count('local_hits')
+                found[key] = value
+        if remote:
+            fetched = self.shared.get_many(remote, version=version)
+            for key in remote:
+                if key in fetched:
+                    self.local.count('shared_hits')
+                    local_key = self.make_key(key, version=version)
+                    self.local.set(local_key, self.bucket_of(local_key), fetched[key], self.local_timeout)
+                else:
+                    self.local.count('misses')
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self.shared.set(key, value, timeout, version=version)
+        self.bump(local_key)
+        self.local.set(local_key, self.bucket_of(local_key), value, self.local_timeout_for(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        if not self.shared.add(key, value, timeout, version=version):
+            return False
+        self.bump(local_key)
+        self.local.set(local_key, self.bucket_of(local_key), value, self.local_timeout_for(timeout))
+        return True
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        local_timeout = self.local_timeout_for(timeout)
+        local_keys = []
+        for key, value in data.items():
+            local_key = self.make_and_validate_key(key, version=version)
+            local_keys.append(local_key)
+            if key not in failed:
+                self.local.set(local_key, self.bucket_of(local_key), value, local_timeout)
+        self.bump(*local_keys)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        touched = self.shared.touch(key, timeout, version=version)
+        # The local copy keeps its own (shorter) expiry; drop it if the key is gone
+        if not touched:
+            self.local.delete(local_key)
+        return touched
+
+    def delete(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self.local.delete(local_key)
+        deleted = self.shared.delete(key, version=version)
+        self.bump(local_key)
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        local_keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        for local_key in local_keys:
+            self.local.delete(local_key)
+        self.shared.delete_many(keys, version=version)
+        self.bump(*local_keys)
+
+    def has_key(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self.sync_generations()
+        if self.local.get(local_key) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        """Atomic only on the Redis tier; the file tier reads and rewrites the value,
+        so concurrent increments there can be lost"""
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self.shared.incr(key, delta, version=version)
+        self.bump(local_key)
+        self.local.set(local_key, self.bucket_of(local_key), value, self.local_timeout)
+        return value
+
+    def clear(self):
+        self.shared.clear()
+        self.local.clear()
+        # Every bucket gets a new token, so every process drops its local tier on its next poll
+        self.bump_buckets(range(self.buckets))
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def stats(self):
+        """Hit/miss counters for this process, plus the current local tier size"""
+        with self.local.lock:
+            counters = dict(self.local.counters)
+            counters['local_entries'] = len(self.local.entries)
+        lookups = counters['local_hits'] + counters['shared_hits'] + counters['misses']
+        counters['hit_rate'] = (counters['local_hits'] + counters['shared_hits']) / lookups if lookups else 0.0
+        return counters
@@ -0,0 +1,194 @@
+# core/mail.py
+"""Outbound email queue.
+
+Web requests call queue_email(), which only inserts an OutboundEmail row (in the
+request's transaction, so a rolled-back registration sends nothing). The
+send_queued_email worker claims due messages in batches and sends each batch
+over one SMTP connection. A failed message is retried after
+EMAIL_RETRY_BACKOFF * 2 ** (attempts - 1) seconds, capped at
+EMAIL_RETRY_MAX_BACKOFF, and is marked dead after EMAIL_MAX_ATTEMPTS attempts.
+
+Message bodies are rendered through email_template(), which compiles each
+template once per process; render_many() renders a list of recipients
+against one shared context.
+"""
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.template import Context, Variable
+from django.template.base import TextNode, VariableNode
+from django.template.loader import get_template
+from django.utils import timezone
+from .models import OutboundEmail
+
+EMAIL_BATCH_SIZE = 50
+
+# A claim older than this belongs to a worker that died mid-batch; its messages are sent again
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+def get_max_attempts():
+    return getattr(settings, 'EMAIL_MAX_ATTEMPTS', 5)
+
+def default_from_email():
+    return getattr(settings, 'DEFAULT_FROM_EMAIL', None) or 'noreply@wepooltribe.com'
+
+def queue_email(subject, body, to, html_body='', from_email=None, kind=''):
+    return OutboundEmail.objects.create(
+        kind=kind,
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or default_from_email(),
+        to=list(to),
+    )
+
+def queue_emails(emails):
+    """Insert many (subject, body, to, html_body, kind) messages in one bulk INSERT per batch"""
+    from_email = default_from_email()
+    return OutboundEmail.objects.bulk_create(
+        [
+            OutboundEmail(kind=kind, subject=subject, body=body, html_body=html_body, from_email=from_email, to=list(to))
+            for subject, body, to, html_body, kind in emails
+        ],
+        batch_size=500,
+    )
+
+class EmailTemplate:
+    """A template compiled once; each render only fills in the given variables"""
+
+    def __init__(self, name):
+        self.name = name
+        # The engine-independent wrapper re-wraps the context on every render; keep the compiled template
+        self.template = get_template(name).template
+
+    def render(self, context):
+        return self.template.render(Context(context))
+
+    def render_many(self, contexts, shared=None):
+        """Yield one rendering per context, each layered over the shared variables.
+
+        Top-level text, and variables that only read shared names, are rendered
+        once for the whole run; per-recipient contexts must not redefine shared names.
+        """
+        shared = shared or {}
+        context = Context(shared)
+        template = self.template
+        with context.render_context.push_state(template), context.bind_template(template):
+            parts = [
+                node.render_annotated(context) if reads_only(node, shared) else node
+                for node in template.nodelist
+            ]
+            for variables in contexts:
+                with context.push(variables):
+                    yield ''.join(
+                        part if isinstance(part, str) else part.render_annotated(context)
+                        for part in parts
+                    )
+
+def reads_only(node, names):
+    """Whether a template node's output depends on nothing but the given context names"""
+    if isinstance(node, TextNode):
+        return True
+    if not isinstance(node, VariableNode):
+        return False
+    expression = node.filter_expression
+    variables = [expression.var] + [arg for _, args in expression.filters for is_variable, arg in args if is_variable]
+    return all(
+        not isinstance(variable, Variable) or variable.lookups is None or variable.lookups[0] in names
+        for variable in variables
+    )
+
+@lru_cache(maxsize=None)
+def email_template(name):
+    return EmailTemplate(name)
+
+def build_message(email, connection=None):
+    message = EmailMultiAlternatives(email.subject, email.body, email.from_email, email.to, connection=connection)
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+def retry_delay(attempts):
+    base = getattr(settings, 'EMAIL_RETRY_BACKOFF', 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), getattr(settings, 'EMAIL_RETRY_MAX_BACKOFF', 3600)))
+
+def due_emails(now):
+    return OutboundEmail.objects.filter(
+        Q(status='queued', next_attempt_at__lte=now) |
+        Q(status='sending', claimed_at__lt=now - CLAIM_TIMEOUT)
+    )
+
+def claim_batch(batch_size=EMAIL_BATCH_SIZE):
+    """Mark up to batch_size due messages as sending and return them, oldest first"""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            due_emails(now).select_for_update(skip_locked=True)
+            .order_by('next_attempt_at').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        # Re-checking "due" keeps the claim exclusive on backends without row locks (SQLite)
+        due_emails(now).filter(pk__in=ids).update(status='sending', claimed_at=now)
+    return list(OutboundEmail.objects.filter(pk__in=ids, status='sending', claimed_at=now).order_by('next_attempt_at'))
+
+def send_batch(emails, connection=None):
+    """Send claimed messages over one connection; returns (sent, retried, dead) counts"""
+    counts = {'sent': 0, 'retried': 0, 'dead': 0}
+    if not emails:
+        return counts
+    connection = connection or get_connection(fail_silently=False)
+
+    try:
+        connection.open()
+    except Exception as e:
+        # The server is unreachable: every message in the batch counts a failed attempt
+        for email in emails:
+            counts[record_failure(email, e)] += 1
+        return counts
+
+    try:
+        for position, email in enumerate(emails):
+            try:
+                connection.send_messages([build_message(email, connection)])
+            except Exception as e:
+                counts[record_failure(email, e)] += 1
+                # Start the next message on a fresh connection in case this one broke
+                connection.close()
+                try:
+                    connection.open()
+                except Exception as e:
+                    for email in emails[position + 1:]:
+                        counts[record_failure(email, e)] += 1
+                    break
+            else:
+                OutboundEmail.objects.filter(pk=email.pk).update(
+                    status='sent',
+                    attempts=email.attempts + 1,
+                    sent_at=timezone.now(),
+                    last_error=''
+                )
+                counts['sent'] += 1
+    finally:
+        connection.close()
+    return counts
+
+def record_failure(email, error):
+    """Reschedule a failed message with backoff, or dead-letter it; returns 'retried' or 'dead'"""
+    attempts = email.attempts + 1
+    if attempts >= get_max_attempts():
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            status='dead', attempts=attempts, last_error=str(error)
+        )
+        return 'dead'
+    OutboundEmail.objects.filter(pk=email.pk).update(
+        status='queued',
+        attempts=attempts,
+        next_attempt_at=timezone.now() + retry_delay(attempts),
+        last_error=str(error)
+    )
+    return 'retried'
@@ -0,0 +1,64 @@
+# Management command for measuring email template rendering throughput
+
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+from core.mail import email_template
+
+TEMPLATES = {
+    'emails/verify_email.html': lambda user, i: {
+        'user': user,
+        'verification_url': f'https://wepooltribe.com/verify-email/{i:032x}/',
+    },
+    'emails/password_reset_email.html': lambda user, i: {
+        'user': user,
+        'uid': f'{i:x}',
+        'token': f'bench-{i:x}',
+    },
+}
+
+SHARED = {
+    'emails/verify_email.html': {'site_name': 'WePool Tribe'},
+    'emails/password_reset_email.html': {'domain': 'wepooltribe.com', 'protocol': 'https'},
+}
+
+class Command(BaseCommand):
+    help = 'Messages rendered per second: render_to_string per message vs. the precompiled email templates'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=5000,
+            help='Messages rendered per template and method'
+        )
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        if count < 1:
+            raise CommandError('--messages must be positive')
+
+        users = [
+            User(username=f'bench{i}', first_name=f'Member{i}', email=f'bench{i}@example.com')
+            for i in range(count)
+        ]
+        for name, variables in TEMPLATES.items():
+            contexts = [variables(user, i) for i, user in enumerate(users)]
+            shared = SHARED[name]
+            template = email_template(name)
+
+            results = [
+                ('render_to_string', lambda: [render_to_string(name, {**shared, **context}) for context in contexts]),
+                ('email_template.render', lambda: [template.render({**shared, **context}) for context in contexts]),
+                ('email_template.render_many', lambda: list(template.render_many(contexts, shared=shared))),
+            ]
+            self.stdout.write(f'{name} ({count} messages)')
+            baseline = None
+            for label, run in results:
+                started = time.perf_counter()
+                run()
+                rate = count / (time.perf_counter() - started)
+                baseline = baseline or rate
+                self.stdout.write(f'  {label:>28}: {rate:10.0f} msg/s ({rate / baseline:.1f}x)')
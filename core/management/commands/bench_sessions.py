@@ -0,0 +1,77 @@
+# Management command for measuring session writes per authenticated request
+
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from core.sessions import SessionStore
+
+ENGINES = [
+    ('db (before)', 'django.contrib.sessions.backends.db'),
+    ('core.sessions (after)', 'core.sessions'),
+]
+
+class Command(BaseCommand):
+    help = 'Count django_session writes per N authenticated requests for the stock db engine and core.sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=1000,
+            help='Authenticated requests per engine'
+        )
+        parser.add_argument(
+            '--seconds-per-request',
+            type=float,
+            default=3.0,
+            help='Simulated time between requests, so interval refreshes show up in a short run'
+        )
+        parser.add_argument(
+            '--url-name',
+            default='dashboard_stats',
+            help='Staff view to request (should not modify the session)'
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive')
+
+        url = reverse(options['url_name'])
+        self.stdout.write(
+            f'{options["requests"]} GET {url}, {options["seconds_per_request"]}s apart (simulated), '
+            f'SESSION_SAVE_EVERY_REQUEST=True'
+        )
+        for label, engine in ENGINES:
+            writes = self.run(engine, url, options['requests'], options['seconds_per_request'])
+            self.stdout.write(f'{label:>24}: {writes} django_session writes')
+
+    def run(self, engine, url, requests, spacing):
+        clock = {'now': SessionStore.clock()}
+
+        with transaction.atomic(), override_settings(
+            SESSION_ENGINE=engine,
+            SESSION_SAVE_EVERY_REQUEST=True,
+            ALLOWED_HOSTS=['testserver'],
+        ), mock.patch.object(SessionStore, 'clock', side_effect=lambda: clock['now']):
+            user = User.objects.create_user('bench_sessions', password='unused', is_staff=True)
+            client = Client()
+            client.force_login(user)
+
+            writes = 0
+            for _ in range(requests):
+                clock['now'] += spacing
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(url, secure=True)
+                if response.status_code != 200:
+                    raise CommandError(f'GET {url} returned {response.status_code}')
+                writes += sum(
+                    1 for query in queries.captured_queries
+                    if query['sql'].startswith(('UPDATE', 'INSERT')) and 'django_session' in query['sql']
+                )
+            transaction.set_rollback(True)
+        return writes
@@ -0,0 +1,26 @@
+# Management command for rebuilding the denormalized referral counters
+
+from django.core.management.base import BaseCommand
+from core.models import ReferralPath, ReferralStats
+
+class Command(BaseCommand):
+    help = 'Rebuild referral counters (and optionally the referral closure table) from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--paths',
+            action='store_true',
+            help='Also rebuild the referral closure table before recounting'
+        )
+
+    def handle(self, *args, **options):
+        if options['paths']:
+            path_count = ReferralPath.rebuild()
+            self.stdout.write(
+                self.style.SUCCESS(f'Rebuilt {path_count} referral paths')
+            )
+
+        stats_count = ReferralStats.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt referral stats for {stats_count} profiles')
+        )
@@ -0,0 +1,50 @@
+# Management command for the outbound email worker process (see the mailer line in the Procfile)
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.mail import EMAIL_BATCH_SIZE, claim_batch, send_batch
+
+class Command(BaseCommand):
+    help = 'Send queued outbound email in batches over one SMTP connection, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Send the messages currently due, then exit'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Seconds to sleep when nothing is due'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=EMAIL_BATCH_SIZE,
+            help='Messages claimed and sent per SMTP connection'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            if getattr(settings, 'ADMIN_NOTIFICATION_MODE', 'instant') == 'digest':
+                # Digest mode needs no scheduler of its own: the worker queues it when the window is up
+                from users.emails import queue_due_admin_digest
+                queue_due_admin_digest()
+
+            emails = claim_batch(options['batch_size'])
+            if not emails:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            counts = send_batch(emails)
+            message = f"Sent {counts['sent']}, retrying {counts['retried']}, dead {counts['dead']}"
+            if counts['retried'] or counts['dead']:
+                self.stderr.write(self.style.WARNING(message))
+            else:
+                self.stdout.write(self.style.SUCCESS(message))
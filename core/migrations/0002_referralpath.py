@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_referral_paths(apps, schema_editor):
+    Referral = apps.get_model('core', 'Referral')
+    ReferralPath = apps.get_model('core', 'ReferralPath')
+
+    parent_of = {}
+    for referrer_id, referred_id in Referral.objects.order_by('id').values_list('referrer_id', 'referred_id'):
+        parent_of.setdefault(referred_id, referrer_id)
+
+    batch = []
+    for descendant_id in parent_of:
+        seen = {descendant_id}
+        ancestor_id, depth = parent_of[descendant_id], 1
+        while ancestor_id is not None and ancestor_id not in seen:
+            batch.append(ReferralPath(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth))
+            seen.add(ancestor_id)
+            ancestor_id, depth = parent_of.get(ancestor_id), depth + 1
+        if len(batch) >= 5000:
+            ReferralPath.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    ReferralPath.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_profile_middle_names'),
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralPath',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_paths', to='users.profile')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_paths', to='users.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ancestor', 'depth'], name='core_refpath_anc_depth_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(build_referral_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:32
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+def build_referral_stats(apps, schema_editor):
+    Referral = apps.get_model('core', 'Referral')
+    ReferralPath = apps.get_model('core', 'ReferralPath')
+    ReferralStats = apps.get_model('core', 'ReferralStats')
+
+    stats = {}
+    for row in Referral.objects.values('referrer_id').annotate(
+        total=Count('id'),
+        paying=Count('id', filter=Q(referred__member_type='paying')),
+        active=Count('id', filter=Q(referred__status__in=['yellow', 'green'])),
+    ):
+        stats[row['referrer_id']] = ReferralStats(
+            profile_id=row['referrer_id'],
+            total_referrals=row['total'],
+            paying_referrals=row['paying'],
+            sponsored_referrals=row['total'] - row['paying'],
+            active_referrals=row['active'],
+        )
+    for row in ReferralPath.objects.filter(depth__lte=4).values('ancestor_id', 'depth').annotate(size=Count('id')):
+        entry = stats.setdefault(row['ancestor_id'], ReferralStats(profile_id=row['ancestor_id']))
+        setattr(entry, f"level_{row['depth']}", row['size'])
+    ReferralStats.objects.bulk_create(stats.values(), batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_profile_middle_names'),
+        ('core', '0002_referralpath'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralStats',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='referral_stats', serialize=False, to='users.profile')),
+                ('total_referrals', models.PositiveIntegerField(default=0)),
+                ('paying_referrals', models.PositiveIntegerField(default=0)),
+                ('sponsored_referrals', models.PositiveIntegerField(default=0)),
+                ('active_referrals', models.PositiveIntegerField(default=0)),
+                ('level_1', models.PositiveIntegerField(default=0)),
+                ('level_2', models.PositiveIntegerField(default=0)),
+                ('level_3', models.PositiveIntegerField(default=0)),
+                ('level_4', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(build_referral_stats, migrations.RunPython.noop),
+    ]
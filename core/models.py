@@ -1,8 +1,13 @@
 #from django.db import models
 
 # Create your models here.
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Q
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from users.models import Profile
+from users.signals import profile_changed
 
 class Referral(models.Model):
     referrer = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='referrals_made')
@@ -24,3 +29,234 @@ class Assignment(models.Model):
 
     def __str__(self):
         return f"Yellow: {self.yellow_member} -> Sponsored: {self.sponsored_member}"
+
+
+class ReferralPath(models.Model):
+    """Closure table of the referral graph: one row per (ancestor, descendant) pair"""
+    ancestor = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='descendant_paths')
+    descendant = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='ancestor_paths')
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ['ancestor', 'descendant']
+        indexes = [
+            models.Index(fields=['ancestor', 'depth'], name='core_refpath_anc_depth_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor} -> {self.descendant} (level {self.depth})"
+
+    @classmethod
+    def rebuild(cls, batch_size=5000):
+        """Rebuild the closure table from the Referral edges"""
+        parent_of = {}
+        for referrer_id, referred_id in Referral.objects.order_by('id').values_list('referrer_id', 'referred_id'):
+            parent_of.setdefault(referred_id, referrer_id)
+
+        paths = []
+        for descendant_id in parent_of:
+            seen = {descendant_id}
+            ancestor_id, depth = parent_of[descendant_id], 1
+            while ancestor_id is not None and ancestor_id not in seen:
+                paths.append(cls(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth))
+                seen.add(ancestor_id)
+                ancestor_id, depth = parent_of.get(ancestor_id), depth + 1
+
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(paths, batch_size=batch_size)
+        return len(paths)
+
+class ReferralStats(models.Model):
+    """Denormalized referral counters for a profile, kept current on write"""
+    ACTIVE_STATUSES = ('yellow', 'green')
+    DOWNLINE_DEPTH = 4
+
+    profile = models.OneToOneField(
+        Profile, on_delete=models.CASCADE, primary_key=True, related_name='referral_stats'
+    )
+    total_referrals = models.PositiveIntegerField(default=0)
+    paying_referrals = models.PositiveIntegerField(default=0)
+    sponsored_referrals = models.PositiveIntegerField(default=0)
+    active_referrals = models.PositiveIntegerField(default=0)
+    level_1 = models.PositiveIntegerField(default=0)
+    level_2 = models.PositiveIntegerField(default=0)
+    level_3 = models.PositiveIntegerField(default=0)
+    level_4 = models.PositiveIntegerField(default=0)
+
+    COUNTER_FIELDS = (
+        'total_referrals', 'paying_referrals', 'sponsored_referrals', 'active_referrals',
+        'level_1', 'level_2', 'level_3', 'level_4'
+    )
+
+    def __str__(self):
+        return f"Referral stats for {self.profile_id}"
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.COUNTER_FIELDS}
+
+    @classmethod
+    def compute(cls, profile_ids=None):
+        """Recompute counters from Referral/ReferralPath; None means every profile"""
+        direct = Referral.objects.all()
+        downline = ReferralPath.objects.filter(depth__lte=cls.DOWNLINE_DEPTH)
+        if profile_ids is not None:
+            direct = direct.filter(referrer_id__in=profile_ids)
+            downline = downline.filter(ancestor_id__in=profile_ids)
+
+        stats = {}
+        for row in direct.values('referrer_id').annotate(
+            total=Count('id'),
+            paying=Count('id', filter=Q(referred__member_type='paying')),
+            active=Count('id', filter=Q(referred__status__in=cls.ACTIVE_STATUSES)),
+        ):
+            stats[row['referrer_id']] = cls(
+                profile_id=row['referrer_id'],
+                total_referrals=row['total'],
+                paying_referrals=row['paying'],
+                sponsored_referrals=row['total'] - row['paying'],
+                active_referrals=row['active'],
+            )
+        for row in downline.values('ancestor_id', 'depth').annotate(size=Count('id')):
+            entry = stats.setdefault(row['ancestor_id'], cls(profile_id=row['ancestor_id']))
+            setattr(entry, f"level_{row['depth']}", row['size'])
+        return stats
+
+    @classmethod
+    def refresh(cls, profile_ids, chunk_size=1000):
+        """Recompute and store the counters of the given profiles"""
+        profile_ids = sorted(set(profile_ids))
+        for start in range(0, len(profile_ids), chunk_size):
+            chunk = set(
+                Profile.objects.filter(id__in=profile_ids[start:start + chunk_size]).values_list('id', flat=True)
+            )
+            if not chunk:
+                continue
+            stats = cls.compute(chunk)
+            cls.objects.bulk_create(
+                [stats.get(profile_id) or cls(profile_id=profile_id) for profile_id in chunk],
+                update_conflicts=True,
+                unique_fields=['profile'],
+                update_fields=cls.COUNTER_FIELDS,
+            )
+
+    @classmethod
+    def rebuild(cls, batch_size=5000):
+        """Rebuild every profile's counters from scratch"""
+        stats = cls.compute()
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(stats.values(), batch_size=batch_size)
+        return len(stats)
+
+class OutboundEmail(models.Model):
+    """A message waiting in the outbox for the send_queued_email worker"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead'),
+    ]
+
+    kind = models.CharField(max_length=50, blank=True, help_text="What the message is for, e.g. verification")
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='core_outbound_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)} ({self.status})"
+
+# Closure table maintenance. The referral graph is a tree (a profile has at most
+# one referrer, and Profile.save() refuses one from its own downline), so linking
+# or unlinking an edge only touches the ancestors of the referrer crossed with
+# the subtree of the referred profile.
+
+def _ancestors_of(profile_id):
+    return [(profile_id, 0)] + list(
+        ReferralPath.objects.filter(descendant_id=profile_id).values_list('ancestor_id', 'depth')
+    )
+
+def _subtree_of(profile_id):
+    return [(profile_id, 0)] + list(
+        ReferralPath.objects.filter(ancestor_id=profile_id).values_list('descendant_id', 'depth')
+    )
+
+def _stats_affected_by(referral):
+    """The referrer plus every ancestor whose 4-level downline includes the referred subtree"""
+    return {referral.referrer_id} | set(
+        ReferralPath.objects.filter(
+            descendant_id=referral.referred_id,
+            depth__lte=ReferralStats.DOWNLINE_DEPTH
+        ).values_list('ancestor_id', flat=True)
+    )
+
+def _refresh_stats_on_commit(profile_ids):
+    # Deferred so cascading profile deletions have finished before counters are written
+    transaction.on_commit(lambda: ReferralStats.refresh(profile_ids))
+
+@receiver(post_save, sender=Referral)
+def link_referral_paths(sender, instance, created, **kwargs):
+    if not created:
+        return
+    ancestors = _ancestors_of(instance.referrer_id)
+    subtree = _subtree_of(instance.referred_id)
+    ReferralPath.objects.bulk_create(
+        [
+            ReferralPath(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=up + down + 1)
+            for ancestor_id, up in ancestors
+            for descendant_id, down in subtree
+        ],
+        ignore_conflicts=True,
+    )
+    _refresh_stats_on_commit(_stats_affected_by(instance))
+
+@receiver(pre_delete, sender=Referral)
+def unlink_referral_paths(sender, instance, **kwargs):
+    # pre_delete so the paths are still intact when a profile deletion cascades here
+    _refresh_stats_on_commit(_stats_affected_by(instance))
+    ancestors = Q(ancestor_id=instance.referrer_id) | Q(
+        ancestor_id__in=ReferralPath.objects.filter(descendant_id=instance.referrer_id).values('ancestor_id')
+    )
+    subtree = Q(descendant_id=instance.referred_id) | Q(
+        descendant_id__in=ReferralPath.objects.filter(ancestor_id=instance.referred_id).values('descendant_id')
+    )
+    ReferralPath.objects.filter(ancestors & subtree).delete()
+
+@receiver(profile_changed, sender=Profile)
+def refresh_referrer_stats(sender, instance, changed, **kwargs):
+    if changed & {'member_type', 'status'}:
+        referrer_ids = set(
+            Referral.objects.filter(referred=instance).values_list('referrer_id', flat=True)
+        )
+        if referrer_ids:
+            _refresh_stats_on_commit(referrer_ids)
+
+@receiver(profile_changed, sender=Profile)
+def move_referral(sender, instance, changed, **kwargs):
+    # Profile.save() re-resolves referred_by when referrer_phone changes; the edge, and with
+    # it the closure paths and counters, follows
+    if 'referrer_phone' not in changed:
+        return
+    edge = Referral.objects.filter(referred=instance).first()
+    if edge is not None and edge.referrer_id == instance.referred_by_id:
+        return
+    with transaction.atomic():
+        if edge is not None:
+            edge.delete()
+        if instance.referred_by_id is not None:
+            Referral.objects.create(referrer_id=instance.referred_by_id, referred=instance)
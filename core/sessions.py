@@ -0,0 +1,38 @@
+# core/sessions.py
+"""Cached-db session engine that coalesces expiry refreshes.
+
+With SESSION_SAVE_EVERY_REQUEST the stock engines rewrite the session row on
+every hit just to push expire_date forward. This store writes through to the
+cache and database only when the session data changed, or when the last write
+is more than SESSION_REFRESH_INTERVAL seconds old. The rolling
+SESSION_COOKIE_AGE window is kept, give or take that interval.
+
+    SESSION_ENGINE = 'core.sessions'
+    SESSION_REFRESH_INTERVAL = 300
+"""
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+# Unix time of the last write, kept inside the session data itself
+REFRESHED_AT_KEY = '_refreshed_at'
+
+class SessionStore(CachedDBStore):
+    @staticmethod
+    def clock():
+        return time.time()
+
+    @property
+    def refresh_interval(self):
+        return getattr(settings, 'SESSION_REFRESH_INTERVAL', 300)
+
+    def refresh_due(self):
+        refreshed_at = self._session.get(REFRESHED_AT_KEY)
+        return refreshed_at is None or self.clock() - refreshed_at >= self.refresh_interval
+
+    def save(self, must_create=False):
+        if not must_create and not self.modified and not self.refresh_due():
+            return
+        self._session[REFRESHED_AT_KEY] = int(self.clock())
+        super().save(must_create)
@@ -1,12 +1,16 @@
 # core/templatetags/core_tags.py
 from django import template
 from core.utils import get_referral_stats as get_stats_util  # Import with different name
+from users.models import ProfileQuerySet
 
 register = template.Library()
 
 @register.simple_tag
 def get_referral_stats(profile):
     """Get referral statistics for a profile"""
+    # Querysets built with Profile.objects.with_referral_stats() carry the counts already
+    if hasattr(profile, 'paying_referrals'):
+        return {name: getattr(profile, name) for name in ProfileQuerySet.REFERRAL_STAT_FIELDS}
     return get_stats_util(profile)  # Call the utility function, not itself
 
 @register.filter
@@ -1,3 +1,340 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .cache import GENERATION_KEY, LocalStore, TieredCache
+from .mail import CLAIM_TIMEOUT, claim_batch, email_template, queue_email, retry_delay, send_batch
+from .models import OutboundEmail, Referral, ReferralPath, ReferralStats
+from .utils import build_referral_tree
+
+def make_profile(username, member_type='paying', status='pending'):
+    user = User.objects.create_user(username, f'{username}@example.com', 'password')
+    profile = user.profile
+    if (profile.member_type, profile.status) != (member_type, status):
+        profile.member_type = member_type
+        profile.status = status
+        profile.save()
+    return profile
+
+def expected_paths():
+    """Closure rows derived directly from the Referral edges"""
+    parent_of = dict(Referral.objects.values_list('referred_id', 'referrer_id'))
+    paths = set()
+    for descendant_id in parent_of:
+        ancestor_id, depth = parent_of[descendant_id], 1
+        while ancestor_id is not None:
+            paths.add((ancestor_id, descendant_id, depth))
+            ancestor_id, depth = parent_of.get(ancestor_id), depth + 1
+    return paths
+
+class ReferralClosureTests(TestCase):
+    def setUp(self):
+        # a -> b -> c -> d, and a -> e
+        self.a = make_profile('a')
+        self.b = make_profile('b', status='yellow')
+        self.c = make_profile('c', member_type='sponsored')
+        self.d = make_profile('d')
+        self.e = make_profile('e', member_type='sponsored', status='green')
+        with self.captureOnCommitCallbacks(execute=True):
+            for referrer, referred in [(self.a, self.b), (self.b, self.c), (self.c, self.d), (self.a, self.e)]:
+                Referral.objects.create(referrer=referrer, referred=referred)
+
+    def stored_paths(self):
+        return set(ReferralPath.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def assertStatsConsistent(self):
+        computed = {profile_id: stats.as_dict() for profile_id, stats in ReferralStats.compute().items()}
+        for stats in ReferralStats.objects.all():
+            self.assertEqual(stats.as_dict(), computed.pop(stats.profile_id, ReferralStats().as_dict()))
+        self.assertEqual(computed, {})
+
+    def test_create_links_every_ancestor(self):
+        self.assertEqual(self.stored_paths(), expected_paths())
+        self.assertIn((self.a.id, self.d.id, 3), self.stored_paths())
+        self.assertStatsConsistent()
+
+        stats = ReferralStats.objects.get(profile=self.a)
+        self.assertEqual(
+            (stats.total_referrals, stats.paying_referrals, stats.sponsored_referrals, stats.active_referrals),
+            (2, 1, 1, 2)
+        )
+        self.assertEqual((stats.level_1, stats.level_2, stats.level_3, stats.level_4), (2, 1, 1, 0))
+
+    def test_deleting_mid_tree_member_unlinks_its_subtree(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.b.user.delete()
+
+        self.assertEqual(self.stored_paths(), expected_paths())
+        self.assertEqual(self.stored_paths(), {(self.c.id, self.d.id, 1), (self.a.id, self.e.id, 1)})
+        self.assertStatsConsistent()
+
+        stats = ReferralStats.objects.get(profile=self.a)
+        self.assertEqual((stats.total_referrals, stats.level_1, stats.level_2, stats.level_3), (1, 1, 0, 0))
+
+    def test_rebuild_matches_incremental_maintenance(self):
+        incremental_paths = self.stored_paths()
+        incremental_stats = {stats.profile_id: stats.as_dict() for stats in ReferralStats.objects.all()}
+
+        ReferralPath.objects.all().delete()
+        ReferralStats.objects.all().delete()
+        ReferralPath.rebuild()
+        ReferralStats.rebuild()
+
+        self.assertEqual(self.stored_paths(), incremental_paths)
+        self.assertStatsConsistent()
+        for profile_id, counters in incremental_stats.items():
+            rebuilt = ReferralStats.objects.filter(profile_id=profile_id).first()
+            self.assertEqual(rebuilt.as_dict() if rebuilt else ReferralStats().as_dict(), counters)
+
+def phones(nodes):
+    return [node['phone'] for node in nodes]
+
+class ReferralTreeTests(TestCase):
+    def setUp(self):
+        # root has five children; the first of them three, and the first of those one more
+        self.root = make_profile('root')
+        self.children = self.refer(self.root, 'child', 5)
+        self.grandchildren = self.refer(self.children[0], 'grandchild', 3)
+        self.refer(self.grandchildren[0], 'great', 1)
+
+    def refer(self, referrer, prefix, count):
+        referred = [make_profile(f'{prefix}{i}') for i in range(count)]
+        for profile in referred:
+            Referral.objects.create(referrer=referrer, referred=profile)
+        return referred
+
+    def queries(self, levels):
+        # One recursive query on PostgreSQL, otherwise one per level walked
+        return 1 if connection.vendor == 'postgresql' else levels
+
+    def test_depth_and_fan_out_caps(self):
+        tree = build_referral_tree(self.root, max_depth=2, max_children=2)
+        self.assertEqual(phones(tree['children']), [profile.phone for profile in self.children[:2]])
+        first, second = tree['children']
+        self.assertEqual(phones(first['children']), [profile.phone for profile in self.grandchildren[:2]])
+        self.assertEqual([node['children'] for node in first['children']], [[], []])
+        self.assertEqual(second['children'], [])
+
+        tree = build_referral_tree(self.root, max_depth=8, max_children=10)
+        self.assertEqual(len(tree['children']), 5)
+        self.assertEqual(len(tree['children'][0]['children'][0]['children']), 1)
+
+    def test_query_count_does_not_grow_with_the_tree(self):
+        with self.assertNumQueries(self.queries(2)):
+            build_referral_tree(self.root, max_depth=2)
+
+        for child in self.children[1:]:
+            self.refer(child, f'wide{child.pk}_', 4)
+        with self.assertNumQueries(self.queries(2)):
+            tree = build_referral_tree(self.root, max_depth=2)
+        self.assertEqual(sum(len(node['children']) for node in tree['children']), 3 + 4 * 4)
+
+        # Walking past the deepest level costs one empty query
+        with self.assertNumQueries(self.queries(4)):
+            build_referral_tree(self.root, max_depth=8)
+
+class ScriptedConnection:
+    """Email connection whose opens and sends fail for the recipients/attempts it is told to"""
+
+    def __init__(self, failing_recipients=(), failing_opens=()):
+        self.failing_recipients = set(failing_recipients)
+        self.failing_opens = set(failing_opens)
+        self.opens = 0
+        self.sent = []
+
+    def open(self):
+        self.opens += 1
+        if self.opens in self.failing_opens:
+            raise ConnectionError('connection refused')
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        for message in messages:
+            if set(message.to) & self.failing_recipients:
+                raise ConnectionError(f'rejected {message.to}')
+            self.sent.append(message)
+        return len(messages)
+
+@override_settings(EMAIL_RETRY_BACKOFF=60, EMAIL_RETRY_MAX_BACKOFF=600, EMAIL_MAX_ATTEMPTS=3)
+class OutboxTests(TestCase):
+    def queue(self, *recipients):
+        for recipient in recipients:
+            queue_email('Subject', 'Body', [recipient])
+        return claim_batch()
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        self.assertEqual([retry_delay(n).total_seconds() for n in range(1, 6)], [60, 120, 240, 480, 600])
+
+    def test_batch_is_sent_over_one_connection(self):
+        connection = ScriptedConnection()
+        self.assertEqual(send_batch(self.queue('a@example.com', 'b@example.com'), connection),
+                         {'sent': 2, 'retried': 0, 'dead': 0})
+        self.assertEqual(connection.opens, 1)
+        self.assertEqual(set(OutboundEmail.objects.values_list('status', 'attempts')), {('sent', 1)})
+
+    def test_failed_message_is_retried_with_backoff_on_a_fresh_connection(self):
+        connection = ScriptedConnection(failing_recipients={'bad@example.com'})
+        before = timezone.now()
+        counts = send_batch(self.queue('bad@example.com', 'good@example.com'), connection)
+
+        self.assertEqual(counts, {'sent': 1, 'retried': 1, 'dead': 0})
+        self.assertEqual(connection.opens, 2)
+        failed = OutboundEmail.objects.get(to=['bad@example.com'])
+        self.assertEqual((failed.status, failed.attempts), ('queued', 1))
+        self.assertIn('rejected', failed.last_error)
+        self.assertGreaterEqual(failed.next_attempt_at, before + timedelta(seconds=60))
+        # Not due again until the backoff has passed
+        self.assertEqual(claim_batch(), [])
+
+    def test_message_is_dead_lettered_after_max_attempts(self):
+        connection = ScriptedConnection(failing_recipients={'bad@example.com'})
+        emails = self.queue('bad@example.com')
+        for expected in ('retried', 'retried', 'dead'):
+            counts = send_batch(emails, connection)
+            self.assertEqual(counts[expected], 1)
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            emails = claim_batch()
+
+        self.assertEqual(emails, [])
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('dead', 3))
+
+    def test_unreachable_server_counts_an_attempt_for_every_message(self):
+        connection = ScriptedConnection(failing_opens={1})
+        counts = send_batch(self.queue('a@example.com', 'b@example.com'), connection)
+        self.assertEqual(counts, {'sent': 0, 'retried': 2, 'dead': 0})
+        self.assertEqual(connection.sent, [])
+
+    def test_failed_reconnect_reschedules_the_rest_of_the_batch(self):
+        connection = ScriptedConnection(failing_recipients={'a@example.com'}, failing_opens={2})
+        counts = send_batch(self.queue('a@example.com', 'b@example.com', 'c@example.com'), connection)
+        self.assertEqual(counts, {'sent': 0, 'retried': 3, 'dead': 0})
+        self.assertEqual(set(OutboundEmail.objects.values_list('status', 'attempts')), {('queued', 1)})
+
+    def test_stale_claims_are_picked_up_again(self):
+        self.assertEqual(len(self.queue('a@example.com')), 1)
+        self.assertEqual(claim_batch(), [])
+        OutboundEmail.objects.update(claimed_at=timezone.now() - CLAIM_TIMEOUT - timedelta(seconds=1))
+        self.assertEqual(len(claim_batch()), 1)
+
+class EmailTemplateTests(SimpleTestCase):
+    # Markup in every kind of value, so a shared or per-recipient part rendered unescaped shows up
+    USERS = [
+        User(username='ann', first_name='Ann <b>&</b>'),
+        User(username='bo"<script>'),
+        User(username='cy', first_name="Cy O'Neil"),
+    ]
+
+    def assertRendersLikeRenderToString(self, name, contexts, shared):
+        rendered = list(email_template(name).render_many(contexts, shared=shared))
+        self.assertEqual(rendered, [render_to_string(name, {**shared, **context}) for context in contexts])
+        return rendered
+
+    def test_verify_email(self):
+        contexts = [
+            {'user': user, 'verification_url': f'https://example.com/verify/{i}/?a=1&b=<{i}>'}
+            for i, user in enumerate(self.USERS)
+        ]
+        rendered = self.assertRendersLikeRenderToString(
+            'emails/verify_email.html', contexts, {'site_name': 'WePool & <Tribe>'}
+        )
+        self.assertIn('Ann &lt;b&gt;&amp;&lt;/b&gt;', rendered[0])
+        self.assertIn('bo&quot;&lt;script&gt;', rendered[1])
+        self.assertNotIn('<Tribe>', rendered[2])
+
+    def test_password_reset(self):
+        contexts = [{'user': user, 'uid': f'MQ{i}', 'token': f'token-{i}'} for i, user in enumerate(self.USERS)]
+        rendered = self.assertRendersLikeRenderToString(
+            'emails/password_reset_email.html', contexts, {'protocol': 'https', 'domain': 'example.com'}
+        )
+        self.assertIn('Hi bo&quot;&lt;script&gt;,', rendered[1])
+        self.assertIn('https://example.com/password-reset-confirm/MQ2/token-2/', rendered[2])
+
+class TieredCacheTests(SimpleTestCase):
+    OPTIONS = {'LOCAL_TIMEOUT': 30, 'GENERATION_CHECK_INTERVAL': 0, 'GENERATION_BUCKETS': 4}
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        # Two "processes": one shared tier, a local tier each
+        self.first = TieredCache(location, {'OPTIONS': self.OPTIONS})
+        self.second = TieredCache(location, {'OPTIONS': self.OPTIONS})
+        self.second.local = LocalStore(1000)
+        self.clock = 1000.0
+        self.addCleanup(self.first.local.clear)
+
+    def advance(self, seconds):
+        self.clock += seconds
+
+    def frozen(self):
+        real_time = time.time()
+        start = self.clock
+        return mock.patch.multiple(
+            time, monotonic=lambda: self.clock, time=lambda: real_time + self.clock - start
+        )
+
+    def test_write_in_one_process_reaches_the_other(self):
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+        self.first.set('key', 'new')
+        self.assertEqual(self.second.get('key'), 'new')
+        self.first.delete('key')
+        self.assertIsNone(self.second.get('key'))
+
+    def test_own_bump_does_not_hide_a_concurrent_bump(self):
+        one_bucket = dict(self.OPTIONS, GENERATION_BUCKETS=1)
+        self.first = TieredCache(self.first.shared._dir, {'OPTIONS': one_bucket})
+        self.second = TieredCache(self.first.shared._dir, {'OPTIONS': one_bucket})
+        self.second.local = LocalStore(1000)
+
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+        self.first.set('key', 'new')
+        # second writes to the same bucket before it polls again
+        self.second.set('other', 'value')
+        self.assertEqual(self.second.get('key'), 'new')
+
+    def test_local_copy_expires_before_a_longer_shared_ttl(self):
+        with self.frozen():
+            self.first.set('key', 'value', timeout=300)
+            self.advance(31)
+            self.assertEqual(self.first.get('key'), 'value')
+        self.assertEqual(self.first.stats()['shared_hits'], 1)
+
+    def test_written_copy_keeps_a_shorter_shared_ttl(self):
+        cache = TieredCache(self.first.shared._dir, {'OPTIONS': dict(self.OPTIONS, GENERATION_CHECK_INTERVAL=3600)})
+        cache.local = LocalStore(1000)
+        with self.frozen():
+            cache.get('warm-up')  # first poll
+            cache.set('key', 'value', timeout=5)
+            self.assertEqual(cache.get('key'), 'value')
+            self.advance(6)
+            self.assertIsNone(cache.get('key'))
+
+    def test_fetched_copy_outlives_the_shared_entry_by_at_most_local_timeout(self):
+        self.first.set('key', 'value', timeout=5)
+        with self.frozen():
+            self.assertEqual(self.second.get('key'), 'value')
+            self.advance(31)
+            self.assertIsNone(self.second.get('key'))
+
+    def test_evicted_generation_key_drops_the_bucket(self):
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+
+        # Change the shared value behind the generations' back, then lose the bucket's generation key
+        self.first.shared.set('key', 'new')
+        bucket = self.second.bucket_of(self.second.make_key('key'))
+        self.assertEqual(self.second.get('key'), 'old')
+        self.first.shared.delete(GENERATION_KEY.format(bucket))
+        self.assertEqual(self.second.get('key'), 'new')
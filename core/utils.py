@@ -1,61 +1,133 @@
 # core/utils.py
-from .models import Referral
+from django.db import connection
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.contrib.auth.models import User
+from users.models import Profile
+from .models import Referral, ReferralPath, ReferralStats
+
+MATRIX_DEPTH = 4
+
+# Default bounds for the referral tree visualisation. The tree used to be drawn in full,
+# however deep; deeper levels are now requested with ?depth= (up to REFERRAL_TREE_MAX_DEPTH)
+TREE_MAX_DEPTH = 4
+TREE_MAX_CHILDREN = 10
 
 def build_referral_matrix(profile):
     """Build a 4-level referral matrix for a profile"""
-    matrix = {
-        'level_1': [],
-        'level_2': [],
-        'level_3': [],
-        'level_4': []
-    }
+    matrix = {f'level_{level}': [] for level in range(1, MATRIX_DEPTH + 1)}
 
-    # Level 1 - Direct referrals
-    level_1_referrals = Referral.objects.filter(referrer=profile).select_related('referred__user')
-    matrix['level_1'] = [ref.referred for ref in level_1_referrals]
-
-    if matrix['level_1']:
-        # Level 2
-        level_2_referrals = Referral.objects.filter(
-            referrer__in=matrix['level_1']
-        ).select_related('referred__user')
-        matrix['level_2'] = [ref.referred for ref in level_2_referrals]
-
-        if matrix['level_2']:
-            # Level 3
-            level_3_referrals = Referral.objects.filter(
-                referrer__in=matrix['level_2']
-            ).select_related('referred__user')
-            matrix['level_3'] = [ref.referred for ref in level_3_referrals]
-
-            if matrix['level_3']:
-                # Level 4
-                level_4_referrals = Referral.objects.filter(
-                    referrer__in=matrix['level_3']
-                ).select_related('referred__user')
-                matrix['level_4'] = [ref.referred for ref in level_4_referrals]
+    # One indexed lookup on the closure table covers all four levels
+    paths = ReferralPath.objects.filter(
+        ancestor=profile,
+        depth__lte=MATRIX_DEPTH
+    ).select_related('descendant__user').order_by('depth', 'id')
+
+    for path in paths:
+        matrix[f'level_{path.depth}'].append(path.descendant)
 
     return matrix
 
 def get_referral_stats(profile):
     """Get referral statistics for a profile"""
-    stats = {
-        'total_referrals': 0,
-        'paying_referrals': 0,
-        'sponsored_referrals': 0,
-        'active_referrals': 0
-    }
+    try:
+        return profile.referral_stats.as_dict()
+    except ReferralStats.DoesNotExist:
+        # Profiles that never referred anyone have no counters row
+        return ReferralStats().as_dict()
+
+async def aget_referral_stats(profile):
+    """get_referral_stats for async views"""
+    stats = await ReferralStats.objects.filter(profile=profile).afirst()
+    return (stats or ReferralStats()).as_dict()
 
-    referrals = Referral.objects.filter(referrer=profile).select_related('referred')
-    stats['total_referrals'] = referrals.count()
+TREE_NODE_FIELDS = (
+    'referrer_id', 'referred_id', 'referred__phone', 'referred__status',
+    'referred__member_type', 'referred__user__first_name', 'referred__user__last_name'
+)
 
-    for referral in referrals:
-        if referral.referred.member_type == 'paying':
-            stats['paying_referrals'] += 1
-        else:
-            stats['sponsored_referrals'] += 1
+def _tree_rows_recursive(profile_id, max_depth, max_children):
+    """Fetch the whole bounded tree with one WITH RECURSIVE query (PostgreSQL).
+
+    The fan-out limit is applied inside the recursion (a LATERAL ... LIMIT per
+    parent), so siblings past the limit and their subtrees are never walked.
+    """
+    qn = connection.ops.quote_name
+    referral_table = qn(Referral._meta.db_table)
+    sql = f"""
+        WITH RECURSIVE tree (referrer_id, referred_id, edge_id, depth) AS (
+            (SELECT referrer_id, referred_id, id, 1
+             FROM {referral_table}
+             WHERE referrer_id = %s
+             ORDER BY id
+             LIMIT %s)
+            UNION ALL
+            SELECT child.referrer_id, child.referred_id, child.id, tree.depth + 1
+            FROM tree
+            CROSS JOIN LATERAL (
+                SELECT r.referrer_id, r.referred_id, r.id
+                FROM {referral_table} r
+                WHERE r.referrer_id = tree.referred_id
+                ORDER BY r.id
+                LIMIT %s
+            ) child
+            WHERE tree.depth < %s
+        )
+        SELECT tree.referrer_id, tree.referred_id, p.phone, p.status, p.member_type, u.first_name, u.last_name
+        FROM tree
+        JOIN {qn(Profile._meta.db_table)} p ON p.id = tree.referred_id
+        JOIN {qn(User._meta.db_table)} u ON u.id = p.user_id
+        ORDER BY tree.depth, tree.referrer_id, tree.edge_id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [profile_id, max_children, max_children, max_depth])
+        return [dict(zip(TREE_NODE_FIELDS, row)) for row in cursor.fetchall()]
+
+def _tree_rows_by_level(profile_id, max_depth, max_children):
+    """Fetch the bounded tree one level per query (SQLite and other backends)"""
+    rows = []
+    frontier = [profile_id]
+    for _ in range(max_depth):
+        level = list(
+            Referral.objects.filter(referrer_id__in=frontier)
+            .annotate(sibling_rank=Window(RowNumber(), partition_by=F('referrer_id'), order_by=F('id').asc()))
+            .filter(sibling_rank__lte=max_children)
+            .order_by('referrer_id', 'sibling_rank')
+            .values(*TREE_NODE_FIELDS)
+        )
+        if not level:
+            break
+        rows.extend(level)
+        frontier = [row['referred_id'] for row in level]
+    return rows
+
+def build_referral_tree(profile, max_depth=TREE_MAX_DEPTH, max_children=TREE_MAX_CHILDREN):
+    """Build the nested referral tree below a profile using a constant number of queries"""
+    if connection.vendor == 'postgresql':
+        rows = _tree_rows_recursive(profile.id, max_depth, max_children)
+    else:
+        rows = _tree_rows_by_level(profile.id, max_depth, max_children)
+
+    root = {
+        'name': profile.user.get_full_name(),
+        'phone': profile.phone,
+        'status': profile.status,
+        'member_type': profile.member_type,
+        'children': []
+    }
 
-        if referral.referred.status in ['yellow', 'green']:
-            stats['active_referrals'] += 1
+    # Rows arrive parents-first, so every node can be attached in a single pass
+    nodes = {profile.id: root}
+    for row in rows:
+        parent = nodes[row['referrer_id']]
+        node = {
+            'name': f"{row['referred__user__first_name']} {row['referred__user__last_name']}".strip(),
+            'phone': row['referred__phone'],
+            'status': row['referred__status'],
+            'member_type': row['referred__member_type'],
+            'children': []
+        }
+        parent['children'].append(node)
+        nodes[row['referred_id']] = node
 
-    return stats
+    return root
@@ -3,13 +3,13 @@ from django.shortcuts import render
 # Create your views here.
 # core/views.py
 from django.shortcuts import render
-from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
 from django.db import connection
 from users.models import Profile
+from users.backends import aget_request_profile
+from users.decorators import login_required, referrer_prompt_exempt, require_GET
 from .models import Referral
-from .utils import build_referral_matrix, get_referral_stats
+from .utils import aget_referral_stats, build_referral_matrix, get_referral_stats
 from django.utils import timezone
 
 @login_required
@@ -26,20 +26,16 @@ def referral_matrix_view(request):
     })
 
 @login_required
-@require_http_methods(["GET"])
-def get_referral_data(request):
+@require_GET
+async def get_referral_data(request):
     """API endpoint to get referral data for charts/visualizations"""
-    profile = request.user.profile
-    matrix = build_referral_matrix(profile)
+    profile = await aget_request_profile(request)
+    stats = await aget_referral_stats(profile)
 
     # Format data for response
-    data = {
-        'level_1': len(matrix['level_1']),
-        'level_2': len(matrix['level_2']),
-        'level_3': len(matrix['level_3']),
-        'level_4': len(matrix['level_4']),
-        'total': sum(len(matrix[level]) for level in matrix)
-    }
+    levels = ['level_1', 'level_2', 'level_3', 'level_4']
+    data = {level: stats[level] for level in levels}
+    data['total'] = sum(stats[level] for level in levels)
 
     return JsonResponse(data)
 
@@ -56,6 +52,7 @@ def direct_referrals_view(request):
         'profile': profile
     })
 
+@referrer_prompt_exempt
 def health_check(request):
     """Health check endpoint for container monitoring"""
     try:
@@ -87,6 +84,7 @@ def health_check(request):
             'timestamp': timezone.now().isoformat()
         }, status=503)
 
+@referrer_prompt_exempt
 def railway_health_check(request):
     """Railway-specific health check endpoint"""
     try:
@@ -122,9 +120,11 @@ def railway_health_check(request):
             'timestamp': timezone.now().isoformat()
         }, status=503)
 
+@referrer_prompt_exempt
 def about_page(request):
     return render(request, 'core/about.html')
 
+@referrer_prompt_exempt
 def contact_page(request):
     if request.method == 'POST':
         # In production, send email or store message
@@ -136,5 +136,6 @@ def contact_page(request):
         return JsonResponse({'success': True})
     return render(request, 'core/contact.html')
 
+@referrer_prompt_exempt
 def terms_page(request):
     return render(request, 'core/terms.html')
@@ -1,3 +1,10 @@
 from django.contrib import admin
+from .models import ExportJob
 
 # Register your models here.
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'format', 'status', 'requested_by', 'rows_written', 'total_rows', 'created_at', 'finished_at')
+    list_filter = ('format', 'status')
+    readonly_fields = ('file_path', 'file_size', 'rows_written', 'total_rows', 'error', 'started_at', 'finished_at')
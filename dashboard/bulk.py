@@ -0,0 +1,47 @@
+# dashboard/bulk.py
+"""Bulk actions for the member list (BulkActionForm.ACTION_CHOICES). Each action
+runs a fixed number of set-based queries however many profiles are selected."""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+from users.qualification import promote, run_qualification_rules
+from .exports import csv_response
+from .stats import invalidate_dashboard_stats
+
+def flipped(field):
+    """CASE expression that negates a boolean column in place"""
+    return Case(When(**{field: True}, then=Value(False)), default=Value(True))
+
+def update_status(profiles, new_status):
+    """Set the status, then re-apply the qualification rules to the same rows (overrides are respected)"""
+    updated = promote(profiles, new_status)
+    run_qualification_rules(profiles)
+    return updated
+
+def toggle_active(profiles, **kwargs):
+    return User.objects.filter(profile__in=profiles).update(is_active=flipped('is_active'))
+
+def toggle_communications(profiles, **kwargs):
+    return profiles.update(communications_opt_in=flipped('communications_opt_in'), updated_at=timezone.now())
+
+def export_selected(profiles, **kwargs):
+    return csv_response(profiles, filename='wepool_selected_users.csv')
+
+BULK_ACTIONS = {
+    'update_status': update_status,
+    'toggle_active': toggle_active,
+    'toggle_communications': toggle_communications,
+    'export_selected': export_selected,
+}
+
+def run_bulk_action(action, profiles, **kwargs):
+    """Run a named action on a Profile queryset; returns the updated row count (or a response for exports)"""
+    handler = BULK_ACTIONS[action]
+    if action == 'export_selected':
+        return handler(profiles, **kwargs)
+    with transaction.atomic():
+        result = handler(profiles, **kwargs)
+        # .update() bypasses the save signals that normally drop the snapshot
+        transaction.on_commit(invalidate_dashboard_stats)
+    return result
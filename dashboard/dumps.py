@@ -0,0 +1,162 @@
+# dashboard/dumps.py
+"""Members backup in PostgreSQL COPY text format.
+
+The dump holds one "COPY table (columns) FROM stdin;" block per table
+(auth_user, users_profile, core_referral), each followed by tab-separated
+rows and a "\\." terminator, then setval() calls for the id sequences. It can
+be restored with psql, or with manage.py load_members, which streams the
+blocks through COPY on PostgreSQL and batched INSERTs elsewhere.
+"""
+import datetime
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from core.models import Referral, ReferralPath, ReferralStats
+from users.models import Profile
+from users.search import rebuild_search_index
+
+DUMP_CHUNK_SIZE = 5000
+
+# Parents before children, so foreign keys resolve as rows arrive
+DUMP_MODELS = [User, Profile, Referral]
+
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+COPY_UNESCAPE = re.compile(r'\\(.)')
+COPY_UNESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v'}
+COPY_HEADER = re.compile(r'^COPY (\w+) \(([^)]*)\) FROM stdin;$')
+NULL = '\\N'
+
+class DumpError(ValueError):
+    pass
+
+def dump_fields(model):
+    return list(model._meta.concrete_fields)
+
+def copy_value(value):
+    if value is None:
+        return NULL
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value).translate(COPY_ESCAPES)
+
+def parse_value(text):
+    if text == NULL:
+        return None
+    return COPY_UNESCAPE.sub(lambda match: COPY_UNESCAPES.get(match.group(1), match.group(1)), text)
+
+def iter_copy_dump(chunk_size=DUMP_CHUNK_SIZE):
+    """Yield the dump line by line, reading each table through a chunked cursor"""
+    yield '-- WePool members dump (PostgreSQL COPY text format)\n'
+    for model in DUMP_MODELS:
+        fields = dump_fields(model)
+        table = model._meta.db_table
+        columns = ', '.join(field.column for field in fields)
+        yield f'\nCOPY {table} ({columns}) FROM stdin;\n'
+        rows = model._base_manager.order_by('pk').values_list(
+            *[field.attname for field in fields]
+        ).iterator(chunk_size=chunk_size)
+        for row in rows:
+            yield '\t'.join(copy_value(value) for value in row) + '\n'
+        yield '\\.\n'
+
+    yield '\n'
+    for model in DUMP_MODELS:
+        table = model._meta.db_table
+        yield (
+            f"SELECT pg_catalog.setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {table};\n"
+        )
+
+def read_copy_blocks(lines):
+    """Yield (table, columns, row lines) for each COPY block; other statements are skipped"""
+    lines = iter(lines)
+    for line in lines:
+        match = COPY_HEADER.match(line.rstrip('\n'))
+        if not match:
+            continue
+        table = match.group(1)
+        columns = [column.strip() for column in match.group(2).split(',')]
+        yield table, columns, _block_rows(lines, table)
+
+def _block_rows(lines, table):
+    for line in lines:
+        if line.rstrip('\n') == '\\.':
+            return
+        yield line
+    raise DumpError(f'COPY block for {table} is not terminated by \\.')
+
+def load_copy_dump(lines, batch_size=DUMP_CHUNK_SIZE):
+    """Load a dump into empty member tables; returns {table: rows loaded}"""
+    models = {model._meta.db_table: model for model in DUMP_MODELS}
+    loaded = {}
+
+    with transaction.atomic():
+        for model in DUMP_MODELS:
+            if model._base_manager.exists():
+                raise DumpError(f'{model._meta.db_table} is not empty; load into a freshly migrated database')
+
+        for table, columns, rows in read_copy_blocks(lines):
+            model = models.get(table)
+            if model is None:
+                raise DumpError(f'Unexpected table in dump: {table}')
+            by_column = {field.column: field for field in dump_fields(model)}
+            unknown = set(columns) - set(by_column)
+            if unknown:
+                raise DumpError(f'Unknown {table} columns: {", ".join(sorted(unknown))}')
+            fields = [by_column[column] for column in columns]
+
+            if connection.vendor == 'postgresql':
+                loaded[table] = _copy_in(table, columns, rows)
+            else:
+                loaded[table] = _bulk_insert(model, fields, rows, batch_size)
+
+        # Serial sequences do not advance for explicit ids
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), DUMP_MODELS):
+                cursor.execute(sql)
+
+        # Derived tables are not dumped; rebuild them from the restored rows
+        ReferralPath.rebuild()
+        ReferralStats.rebuild()
+        rebuild_search_index()
+
+    return loaded
+
+def _copy_in(table, columns, rows):
+    count = 0
+    quoted = ', '.join(connection.ops.quote_name(column) for column in columns)
+    with connection.cursor() as cursor:
+        with cursor.copy(f'COPY {connection.ops.quote_name(table)} ({quoted}) FROM STDIN') as copy:
+            for line in rows:
+                copy.write(line)
+                count += 1
+    return count
+
+def _bulk_insert(model, fields, rows, batch_size):
+    """Batched executemany INSERTs; bulk_create would overwrite auto_now timestamps"""
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    sql = f'INSERT INTO {table} ({columns}) VALUES ({placeholders})'
+
+    count, batch = 0, []
+    with connection.cursor() as cursor:
+        for line in rows:
+            values = line.rstrip('\n').split('\t')
+            if len(values) != len(fields):
+                raise DumpError(f'{model._meta.db_table} row {count + 1} has {len(values)} columns, expected {len(fields)}')
+            batch.append([
+                field.get_db_prep_value(field.to_python(parse_value(value)), connection)
+                for field, value in zip(fields, values)
+            ])
+            count += 1
+            if len(batch) >= batch_size:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+    return count
@@ -0,0 +1,255 @@
+# dashboard/exports.py
+"""Member export pipeline: rows are read from a server-side cursor in chunks and
+written out one encoded line at a time, so memory stays flat however many
+members are exported. Shared by the dashboard, export_members and the
+run_export_worker process that builds ExportJob artifacts under MEDIA_ROOT."""
+import csv
+import json
+import os
+import re
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import BooleanField
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from users.models import Profile
+from .models import ExportJob
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Artifacts live under MEDIA_ROOT/exports and are only served through the staff download view
+EXPORT_DIR = 'exports'
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def get_claim_timeout():
+    """A running job claimed longer ago than this belongs to a worker that died; it is run again.
+    Must exceed the longest export (EXPORT_CLAIM_TIMEOUT, in minutes)."""
+    return timedelta(minutes=getattr(settings, 'EXPORT_CLAIM_TIMEOUT', 30))
+
+# (header, lookup) for every exported column, in file order
+EXPORT_COLUMNS = [
+    ('Username', 'user__username'),
+    ('Email', 'user__email'),
+    ('First Name', 'user__first_name'),
+    ('Last Name', 'user__last_name'),
+    ('Phone', 'phone'),
+    ('Member Type', 'member_type'),
+    ('Status', 'status'),
+    ('Referrer Phone', 'referrer_phone'),
+    ('Verified Email', 'verified_email'),
+    ('Registered TAC Connector', 'registered_tacconnector'),
+    ('TAC Connector Link', 'tacconnector_link'),
+    ('Is Active', 'user__is_active'),
+    ('Is Staff', 'user__is_staff'),
+    ('Qualification Overridden', 'qualification_overridden'),
+    ('Override Reason', 'override_reason'),
+    ('Overridden By', 'overridden_by__username'),
+    ('Admin Promotion Overridden', 'admin_promotion_overridden'),
+    ('Admin Override Reason', 'admin_override_reason'),
+    ('Admin Override By', 'admin_overridden_by__username'),
+    ('Created At', 'created_at'),
+    ('Updated At', 'updated_at'),
+]
+
+class Echo:
+    """File-like object whose write() hands the line back instead of buffering it"""
+    def write(self, value):
+        return value
+
+def export_rows(queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one tuple of display values per profile, in id order"""
+    if queryset is None:
+        queryset = Profile.objects.all()
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    rows = queryset.order_by('id').values_list(*lookups).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield tuple(format_value(value) for value in row)
+
+def format_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'strftime'):
+        return value.strftime(DATETIME_FORMAT)
+    return value
+
+def iter_csv(queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the CSV export line by line, header first"""
+    writer = csv.writer(Echo())
+    yield writer.writerow([header for header, _ in EXPORT_COLUMNS])
+    for row in export_rows(queryset, chunk_size):
+        yield writer.writerow(row)
+
+def csv_response(queryset=None, filename='wepool_users_with_overrides.csv'):
+    response = StreamingHttpResponse(iter_csv(queryset), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def column_keys():
+    """snake_case column names for the JSON Lines and Parquet formats"""
+    return [header.lower().replace(' ', '_') for header, _ in EXPORT_COLUMNS]
+
+def iter_jsonl(queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+    keys = column_keys()
+    for row in export_rows(queryset, chunk_size):
+        yield json.dumps(dict(zip(keys, row)), cls=DjangoJSONEncoder) + '\n'
+
+def available_formats():
+    """Job formats this install can produce; Parquet needs the optional pyarrow package"""
+    formats = ['csv', 'jsonl']
+    if pyarrow is not None:
+        formats.append('parquet')
+    return formats
+
+def is_boolean_column(lookup):
+    model = Profile
+    *relations, name = lookup.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return isinstance(model._meta.get_field(name), BooleanField)
+
+def write_text(path, lines, progress, chunk_size, header_lines=0):
+    """Write an iterator of lines, reporting rows written every chunk; returns the row count"""
+    written = -header_lines
+    with open(path, 'w', newline='', encoding='utf-8') as output:
+        for line in lines:
+            output.write(line)
+            written += 1
+            if written and written % chunk_size == 0:
+                progress(written)
+    return written
+
+def write_parquet(path, queryset, progress, chunk_size):
+    keys = column_keys()
+    schema = pyarrow.schema([
+        (key, pyarrow.bool_() if is_boolean_column(lookup) else pyarrow.string())
+        for key, (_, lookup) in zip(keys, EXPORT_COLUMNS)
+    ])
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        batch, written = [], 0
+        for row in export_rows(queryset, chunk_size):
+            batch.append(row)
+            if len(batch) == chunk_size:
+                writer.write_batch(pyarrow.RecordBatch.from_pydict(dict(zip(keys, zip(*batch))), schema=schema))
+                written += len(batch)
+                batch = []
+                progress(written)
+        if batch:
+            writer.write_batch(pyarrow.RecordBatch.from_pydict(dict(zip(keys, zip(*batch))), schema=schema))
+            written += len(batch)
+    return written
+
+def run_export_job(job, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write the artifact for a claimed (running) ExportJob and mark it done; returns False
+    (and discards the artifact) if the claim went stale and another worker took the job"""
+    queryset = Profile.objects.all()
+    ExportJob.objects.filter(pk=job.pk).update(total_rows=queryset.count())
+
+    relative = f'{EXPORT_DIR}/wepool_members_{job.pk}_{uuid.uuid4().hex[:12]}.{job.format}'
+    path = Path(settings.MEDIA_ROOT) / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + '.part')
+
+    def progress(rows_written):
+        ExportJob.objects.filter(pk=job.pk).update(rows_written=rows_written)
+
+    try:
+        if job.format == 'csv':
+            written = write_text(partial, iter_csv(queryset, chunk_size), progress, chunk_size, header_lines=1)
+        elif job.format == 'jsonl':
+            written = write_text(partial, iter_jsonl(queryset, chunk_size), progress, chunk_size)
+        elif job.format == 'parquet' and pyarrow is not None:
+            written = write_parquet(partial, queryset, progress, chunk_size)
+        else:
+            raise ValueError(f'Unsupported export format: {job.format}')
+        os.replace(partial, path)
+    finally:
+        if partial.exists():
+            partial.unlink()
+
+    # Only the worker holding the current claim may finish the job
+    finished = ExportJob.objects.filter(pk=job.pk, status='running', started_at=job.started_at).update(
+        status='done',
+        file_path=relative,
+        file_size=path.stat().st_size,
+        rows_written=written,
+        finished_at=timezone.now()
+    )
+    if not finished:
+        path.unlink()
+        return False
+    job.refresh_from_db()
+    return True
+
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def iter_file_range(path, start, length, block_size=64 * 1024):
+    with open(path, 'rb') as source:
+        source.seek(start)
+        while length > 0:
+            block = source.read(min(block_size, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+def requested_range(header, size):
+    """(start, end) for a single-range Range header, None to serve the whole file,
+    or () when the range cannot be satisfied"""
+    match = RANGE_HEADER.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        # A syntactically invalid range is ignored, not refused (RFC 9110 14.2)
+        return None
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the final N bytes
+        start, end = max(0, size - int(last)), size - 1
+    if start > end or start >= size:
+        return ()
+    return start, end
+
+def ranged_file_response(request, path, filename, content_type):
+    """Serve a file as an attachment, honouring a single-range Range header with 206 Partial Content"""
+    size = os.path.getsize(path)
+    byte_range = requested_range(request.headers.get('Range', ''), size)
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+    if not byte_range:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range
+    response = StreamingHttpResponse(
+        iter_file_range(path, start, end - start + 1),
+        status=206,
+        content_type=content_type
+    )
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -275,6 +275,27 @@ class ProfileFilterForm(forms.Form):
         }),
         label='Search'
     )
+    # Each option maps to (field, descending) in SORT_OPTIONS; every field is indexed with id,
+    # except 'relevance', which orders by the search_rank annotation and needs a search term
+    SORT_OPTIONS = {
+        'relevance': ('search_rank', True),
+        'newest': ('created_at', True),
+        'oldest': ('created_at', False),
+        'updated': ('updated_at', True),
+        'phone': ('phone', False),
+    }
+    sort = forms.ChoiceField(
+        choices=[
+            ('relevance', 'Best Match'),
+            ('newest', 'Newest First'),
+            ('oldest', 'Oldest First'),
+            ('updated', 'Recently Updated'),
+            ('phone', 'Phone Number'),
+        ],
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+        label='Sort By'
+    )
 
 class BulkActionForm(forms.Form):
     """Form for bulk actions on multiple users"""
@@ -0,0 +1,106 @@
+# Management command for checking that the dashboard queries are served by indexes
+
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from users.models import Profile
+from users.search import refresh_search_text
+
+# Plans that read the whole profile table: PostgreSQL "Seq Scan on users_profile"; SQLite
+# "SCAN users_profile", unless it walks a partial index (which holds only matching rows)
+PARTIAL_INDEXES = '|'.join(index.name for index in Profile._meta.indexes if index.condition is not None)
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on users_profile\b'),
+    'sqlite': re.compile(rf'\bSCAN users_profile\b(?! USING (?:COVERING )?INDEX (?:{PARTIAL_INDEXES})\b)'),
+}
+
+def dashboard_queries():
+    """The Profile querysets behind the dashboard queues and override filters"""
+    return {
+        'paying_queue': Profile.objects.filter(
+            member_type='paying', status='pending'
+        ).select_related('user', 'overridden_by'),
+        'sponsored_queue': Profile.objects.filter(
+            member_type='sponsored', status='pending'
+        ).select_related('user', 'overridden_by').with_referral_stats(),
+        'yellow_members': Profile.objects.filter(
+            status='yellow', paid_for_sponsored=False
+        ).select_related('user', 'overridden_by'),
+        'qualified_sponsored': Profile.objects.filter(
+            member_type='sponsored', status='qualified', paid_for_self=False
+        ).select_related('user', 'overridden_by').with_referral_stats(),
+        'override_history': Profile.objects.filter(
+            qualification_overridden=True
+        ).select_related('user', 'overridden_by').order_by('-override_date'),
+        'admin_override_history': Profile.objects.filter(
+            admin_promotion_overridden=True
+        ).select_related('user', 'admin_overridden_by').order_by('-admin_override_date'),
+    }
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the dashboard queue queries and fail if any plans a sequential scan of users_profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=100000,
+            help='Profiles to generate first (rolled back afterwards); 0 to explain against the current data'
+        )
+
+    def handle(self, *args, **options):
+        pattern = SEQ_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f'No plan check for the {connection.vendor} backend')
+
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options['seed'])
+            failures = []
+            for name, queryset in dashboard_queries().items():
+                plan = queryset.explain()
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f'{name}:\n{plan}\n')
+                if pattern.search(plan):
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(f'{name}: sequential scan'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'{name}: indexed'))
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f'Sequential scans in: {", ".join(failures)}')
+
+    def seed(self, count):
+        """Insert count users and profiles with a production-like status mix, then refresh planner statistics"""
+        self.stdout.write(f'Seeding {count} profiles...')
+        first_id = (User.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        for start in range(0, count, 5000):
+            numbers = range(start, min(start + 5000, count))
+            users = User.objects.bulk_create([
+                User(username=f'explain_seed_{first_id + i}', password='!') for i in numbers
+            ])
+            Profile.objects.bulk_create([
+                Profile(user=user, phone=f'seed{first_id + i:011d}', **self.seed_fields(i))
+                for i, user in zip(numbers, users)
+            ])
+        # bulk_create skips Profile.save(), which fills search_text
+        refresh_search_text(Profile.objects.filter(user_id__gte=first_id))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    @staticmethod
+    def seed_fields(i):
+        # Most members have moved through the queues; pending/yellow/qualified are a few percent each
+        bucket = i % 100
+        status = 'pending' if bucket < 3 else 'yellow' if bucket < 6 else 'qualified' if bucket < 8 else 'green'
+        return {
+            'member_type': 'sponsored' if i % 3 == 0 else 'paying',
+            'status': status,
+            'paid_for_self': status == 'green',
+            'paid_for_sponsored': status == 'green' or i % 7 == 0,
+            'qualification_overridden': i % 500 == 0,
+            'admin_promotion_overridden': i % 2000 == 0,
+        }
@@ -0,0 +1,46 @@
+# Management command for exporting members without going through a web worker
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.dumps import iter_copy_dump
+from dashboard.exports import EXPORT_CHUNK_SIZE, iter_csv
+
+class Command(BaseCommand):
+    help = 'Stream the member export (CSV, or a COPY-format backup for load_members) to a file or stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'copy'],
+            default='csv',
+            help='csv for spreadsheets, copy for a restorable backup of users, profiles and referrals'
+        )
+        parser.add_argument(
+            '--output',
+            help='File to write (defaults to stdout)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help='Rows fetched from the database cursor at a time'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        if options['format'] == 'copy':
+            lines = iter_copy_dump(chunk_size=options['chunk_size'])
+        else:
+            lines = iter_csv(chunk_size=options['chunk_size'])
+
+        if not options['output']:
+            # Write straight to the process stdout: self.stdout would append a newline per write
+            sys.stdout.writelines(lines)
+            return
+
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            output.writelines(lines)
+        self.stderr.write(self.style.SUCCESS(f'Exported members to {options["output"]}'))
@@ -0,0 +1,32 @@
+# Management command for restoring a members dump (export_members --format copy)
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.dumps import DUMP_CHUNK_SIZE, DumpError, load_copy_dump
+
+class Command(BaseCommand):
+    help = 'Load a COPY-format members dump into empty tables (COPY on PostgreSQL, batched INSERTs elsewhere)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Dump file written by export_members --format copy or the dashboard')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DUMP_CHUNK_SIZE,
+            help='Rows per INSERT batch when COPY is not available'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            with open(options['path'], encoding='utf-8', newline='\n') as dump:
+                loaded = load_copy_dump(dump, batch_size=options['batch_size'])
+        except (OSError, DumpError) as e:
+            raise CommandError(str(e))
+
+        for table, count in loaded.items():
+            self.stdout.write(f'{table}: {count} rows')
+        self.stdout.write(
+            self.style.SUCCESS(f'Loaded members dump in {time.monotonic() - started:.1f}s')
+        )
@@ -0,0 +1,85 @@
+# Management command for the export worker process (see the worker line in the Procfile)
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from dashboard.exports import EXPORT_CHUNK_SIZE, get_claim_timeout, run_export_job
+from dashboard.models import ExportJob
+
+class Command(BaseCommand):
+    help = 'Build queued member exports outside the web workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the jobs currently queued, then exit'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to sleep when the queue is empty'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help='Rows fetched per cursor round trip (and per progress update)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # Replace a connection the database dropped or timed out while we slept
+            close_old_connections()
+            job = self.claim_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f'Running {job}')
+            try:
+                finished = run_export_job(job, chunk_size=options['chunk_size'])
+            except Exception as e:
+                ExportJob.objects.filter(pk=job.pk, status='running', started_at=job.started_at).update(
+                    status='failed',
+                    error=str(e),
+                    finished_at=timezone.now()
+                )
+                self.stderr.write(self.style.ERROR(f'Export #{job.pk} failed: {e}'))
+            else:
+                if finished:
+                    self.stdout.write(self.style.SUCCESS(f'Export #{job.pk} done: {job.rows_written} rows'))
+                else:
+                    self.stderr.write(f'Export #{job.pk} was taken over by another worker; discarded this run')
+
+    @staticmethod
+    def claimable_jobs(now):
+        # Queued jobs, plus running ones whose worker died (killed, redeployed, out of memory)
+        return ExportJob.objects.filter(
+            Q(status='queued') | Q(status='running', started_at__lt=now - get_claim_timeout())
+        )
+
+    @classmethod
+    def claim_job(cls):
+        """Take the oldest claimable job; skip_locked lets several workers share the queue"""
+        while True:
+            now = timezone.now()
+            with transaction.atomic():
+                job = cls.claimable_jobs(now).select_for_update(skip_locked=True).order_by('created_at').first()
+                if job is None:
+                    return None
+                # Re-checking the filter keeps the claim exclusive on backends without row locks (SQLite)
+                claimed = cls.claimable_jobs(now).filter(pk=job.pk).update(
+                    status='running',
+                    started_at=now,
+                    rows_written=0
+                )
+            if claimed:
+                job.refresh_from_db()
+                return job
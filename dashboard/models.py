@@ -1,3 +1,99 @@
-from django.db import models
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from users.models import Profile
+from users.signals import profile_changed
 
-# Create your models here.
+class ExportJob(models.Model):
+    """A member export produced by the run_export_worker process instead of a web worker"""
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON Lines'),
+        ('parquet', 'Parquet'),
+    ]
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    requested_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='export_jobs'
+    )
+    total_rows = models.PositiveIntegerField(default=0)
+    rows_written = models.PositiveIntegerField(default=0)
+    file_path = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="Artifact path relative to MEDIA_ROOT"
+    )
+    file_size = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='dash_exportjob_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_format_display()} export #{self.pk} ({self.status})"
+
+    @property
+    def progress(self) -> int:
+        if self.status == 'done':
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(99, self.rows_written * 100 // self.total_rows)
+
+# Writes that change the dashboard counts drop the cached snapshot once the
+# transaction commits (bulk .update() calls are covered by the snapshot TTL).
+# Logins save the user and then its profile without changing anything counted,
+# so those saves leave the snapshot alone.
+
+# Profile fields the snapshot counts (created_at only matters for new rows)
+COUNTED_PROFILE_FIELDS = frozenset({
+    'member_type', 'verified_email', 'registered_tacconnector', 'status', 'qualification_overridden',
+    'admin_promotion_overridden',
+})
+
+def drop_stats_snapshot():
+    from .stats import invalidate_dashboard_stats
+    transaction.on_commit(invalidate_dashboard_stats)
+
+@receiver(post_save, sender=User)
+def invalidate_stats_on_user_save(sender, created, update_fields=None, **kwargs):
+    # is_active is the only user field counted
+    if created or update_fields is None or 'is_active' in update_fields:
+        drop_stats_snapshot()
+
+@receiver(post_save, sender=Profile)
+def invalidate_stats_on_profile_create(sender, created, **kwargs):
+    # Changes to existing profiles arrive through profile_changed
+    if created:
+        drop_stats_snapshot()
+
+@receiver(profile_changed, sender=Profile)
+def invalidate_stats_on_profile_change(sender, changed, **kwargs):
+    if changed & COUNTED_PROFILE_FIELDS:
+        drop_stats_snapshot()
+
+@receiver(post_save, sender='core.Assignment')
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Profile)
+@receiver(post_delete, sender='core.Assignment')
+def invalidate_stats_snapshot(sender, **kwargs):
+    drop_stats_snapshot()
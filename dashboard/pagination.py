@@ -0,0 +1,81 @@
+# dashboard/pagination.py
+"""Keyset (seek) pagination: pages are fetched with WHERE (sort, id) < (value, last_id)
+instead of OFFSET, so every page costs the same regardless of its position."""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Paginate a queryset on (sort_field, id); sort_field should lead an index ending in id,
+    or name an annotation (e.g. a search rank) with a concrete output_field"""
+
+    def __init__(self, queryset, sort_field, descending=False, per_page=50):
+        self.queryset = queryset
+        self.sort_field = sort_field
+        self.descending = descending
+        self.per_page = per_page
+        self.annotation = queryset.query.annotations.get(sort_field)
+        if self.annotation is not None:
+            self.field = self.annotation.output_field
+        else:
+            self.field = queryset.model._meta.get_field(sort_field)
+
+    def ordering(self):
+        prefix = '-' if self.descending else ''
+        return [f'{prefix}{self.sort_field}', f'{prefix}id']
+
+    def encode_cursor(self, obj):
+        if self.annotation is not None:
+            value = getattr(obj, self.sort_field)
+        else:
+            value = self.field.value_to_string(obj)
+        raw = json.dumps([value, obj.pk]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            return self.field.to_python(value), int(pk)
+        except (ValueError, TypeError, ValidationError) as e:
+            raise InvalidCursor(f'Invalid cursor: {cursor}') from e
+
+    def page(self, cursor=None):
+        queryset = self.queryset.order_by(*self.ordering())
+        if cursor:
+            value, pk = self.decode_cursor(cursor)
+            op = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.sort_field}__{op}': value}) |
+                Q(**{self.sort_field: value, f'id__{op}': pk})
+            )
+
+        rows = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = self.encode_cursor(rows[-1])
+        return KeysetPage(rows, next_cursor)
@@ -0,0 +1,93 @@
+# dashboard/stats.py
+"""Dashboard headline counts: one conditional-aggregation query per table, served
+from a cached snapshot that expires after DASHBOARD_STATS_TTL seconds and is
+dropped when a write changes something it counts (see dashboard.models)."""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+from core.models import Assignment
+from users.models import Profile
+
+CACHE_KEY = 'dashboard:stats'
+
+def get_ttl():
+    return getattr(settings, 'DASHBOARD_STATS_TTL', 30)
+
+def profile_aggregates():
+    last_week = timezone.now() - timedelta(days=7)
+    return {
+        'total_users': Count('id'),
+        'paying_members': Count('id', filter=Q(member_type='paying')),
+        'sponsored_members': Count('id', filter=Q(member_type='sponsored')),
+        'active_users': Count('id', filter=Q(user__is_active=True)),
+        'verified_emails': Count('id', filter=Q(verified_email=True)),
+        'tac_connector_registrations': Count('id', filter=Q(registered_tacconnector=True)),
+        'pending': Count('id', filter=Q(status='pending')),
+        'yellow': Count('id', filter=Q(status='yellow')),
+        'green': Count('id', filter=Q(status='green')),
+        'qualified': Count('id', filter=Q(status='qualified')),
+        'qualification_overrides': Count('id', filter=Q(qualification_overridden=True)),
+        'admin_overrides': Count('id', filter=Q(admin_promotion_overridden=True)),
+        'recent_registrations': Count('id', filter=Q(created_at__gte=last_week)),
+    }
+
+ASSIGNMENT_AGGREGATES = {
+    'completed_count': Count('id', filter=Q(completed=True)),
+    'pending_count': Count('id', filter=Q(completed=False)),
+}
+
+def build_stats(profiles, assignments):
+    return {
+        'total_users': profiles['total_users'],
+        'paying_members': profiles['paying_members'],
+        'sponsored_members': profiles['sponsored_members'],
+        'active_users': profiles['active_users'],
+        'verified_emails': profiles['verified_emails'],
+        'tac_connector_registrations': profiles['tac_connector_registrations'],
+        'status_breakdown': {
+            status: profiles[status] for status in ('pending', 'yellow', 'green', 'qualified')
+        },
+        'overrides': {
+            'qualification_overrides': profiles['qualification_overrides'],
+            'admin_overrides': profiles['admin_overrides']
+        },
+        'recent_registrations': profiles['recent_registrations'],
+        'assignments': {
+            'completed': assignments['completed_count'],
+            'pending': assignments['pending_count']
+        },
+        'generated_at': timezone.now().isoformat(),
+    }
+
+def compute_dashboard_stats():
+    return build_stats(
+        Profile.objects.aggregate(**profile_aggregates()),
+        Assignment.objects.aggregate(**ASSIGNMENT_AGGREGATES),
+    )
+
+async def acompute_dashboard_stats():
+    return build_stats(
+        await Profile.objects.aaggregate(**profile_aggregates()),
+        await Assignment.objects.aaggregate(**ASSIGNMENT_AGGREGATES),
+    )
+
+def get_dashboard_stats():
+    """The cached snapshot, recomputed when it has expired or been invalidated"""
+    stats = cache.get(CACHE_KEY)
+    if stats is None:
+        stats = compute_dashboard_stats()
+        cache.set(CACHE_KEY, stats, get_ttl())
+    return stats
+
+async def aget_dashboard_stats():
+    stats = await cache.aget(CACHE_KEY)
+    if stats is None:
+        stats = await acompute_dashboard_stats()
+        await cache.aset(CACHE_KEY, stats, get_ttl())
+    return stats
+
+def invalidate_dashboard_stats():
+    cache.delete(CACHE_KEY)
@@ -1,3 +1,329 @@
-from django.test import TestCase
+import base64
+import json
+import csv
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from core.models import Referral, ReferralPath, ReferralStats
+from users.models import Profile
+
+from .dumps import DUMP_MODELS, dump_fields
+from .exports import ranged_file_response, run_export_job
+from .models import ExportJob
+from .pagination import InvalidCursor, KeysetPaginator
+from .stats import CACHE_KEY, get_dashboard_stats, invalidate_dashboard_stats
+
+def encode(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        for i in range(7):
+            User.objects.create_user(f'member{i}', f'member{i}@example.com', 'password')
+        # Two pairs of identical timestamps, so the id tie-breaker is exercised across page edges
+        now = timezone.now()
+        for offset, profile in zip([0, 0, 1, 2, 2, 3, 4], Profile.objects.order_by('id')):
+            Profile.objects.filter(pk=profile.pk).update(created_at=now - timedelta(hours=offset))
+
+    def walk(self, paginator):
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            seen += [profile.pk for profile in page]
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_cursor_round_trip_visits_every_row_once(self):
+        for descending in (True, False):
+            with self.subTest(descending=descending):
+                paginator = KeysetPaginator(Profile.objects.all(), 'created_at', descending=descending, per_page=3)
+                expected = list(Profile.objects.order_by(*paginator.ordering()).values_list('pk', flat=True))
+                self.assertEqual(self.walk(paginator), expected)
+
+    def test_cursor_decodes_to_its_row(self):
+        paginator = KeysetPaginator(Profile.objects.all(), 'created_at', descending=True, per_page=3)
+        last = list(paginator.page())[-1]
+        self.assertEqual(paginator.decode_cursor(paginator.encode_cursor(last)), (last.created_at, last.pk))
+
+    def test_tampered_cursors_are_rejected(self):
+        paginator = KeysetPaginator(Profile.objects.all(), 'created_at', descending=True, per_page=3)
+        for cursor in [
+            'not base64!',
+            base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+            encode({'value': 1}),
+            encode(5),
+            encode(['2024-01-01T00:00:00+00:00']),
+            encode(['2024-01-01T00:00:00+00:00', 'one']),
+            encode(['2024-01-01T00:00:00+00:00', None]),
+            encode(['yesterday', 1]),
+            encode([[2024], 1]),
+        ]:
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+    def test_views_refuse_a_bad_cursor(self):
+        staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        self.client.force_login(staff)
+        params = {'status': 'pending', 'cursor': encode(['yesterday', 1])}
+
+        response = self.client.get(reverse('view_all_users_data'), params)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+        response = self.client.get(reverse('view_all_users'), params)
+        self.assertRedirects(response, reverse('view_all_users') + '?status=pending', fetch_redirect_response=False)
+
+    def test_quick_statistics_count_every_member(self):
+        staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        self.client.force_login(staff)
+        Profile.objects.update(verified_email=True)
+        invalidate_dashboard_stats()
+
+        with mock.patch('dashboard.views.USERS_PER_PAGE', 2):
+            response = self.client.get(reverse('view_all_users'))
+        self.assertEqual(len(response.context['profiles']), 2)
+        self.assertEqual(response.context['stats']['total_users'], 8)
+        self.assertEqual(response.context['stats']['verified_emails'], 8)
+
+class StatsInvalidationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('member', 'member@example.com', 'password')
+        self.profile = Profile.objects.get(user=self.user)
+        invalidate_dashboard_stats()
+        self.addCleanup(invalidate_dashboard_stats)
+        self.assertEqual(get_dashboard_stats()['verified_emails'], 0)
+
+    def is_cached(self):
+        return cache.get(CACHE_KEY) is not None
+
+    def test_counted_field_change_drops_the_snapshot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.verified_email = True
+            self.profile.save()
+        self.assertFalse(self.is_cached())
+        self.assertEqual(get_dashboard_stats()['verified_emails'], 1)
+
+    def test_deactivating_the_user_drops_the_snapshot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save(update_fields=['is_active'])
+        self.assertEqual(get_dashboard_stats()['active_users'], 0)
+
+    def test_unrelated_saves_keep_the_snapshot(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.profile.city = 'Springfield'
+            self.profile.save()
+            self.assertTrue(self.client.login(username='member', password='password'))
+        self.assertEqual(callbacks, [])
+        self.assertTrue(self.is_cached())
+
+class BulkActionTests(TestCase):
+    def setUp(self):
+        staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        self.client.force_login(staff)
+        self.referrer = Profile.objects.get(user=User.objects.create_user('referrer', 'referrer@example.com', 'password'))
+        self.members = [
+            Profile.objects.get(user=User.objects.create_user(f'member{i}', f'member{i}@example.com', 'password'))
+            for i in range(3)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            for member in self.members:
+                Referral.objects.create(referrer=self.referrer, referred=member)
+        # member1 starts inactive and opted out, so a toggle has to move rows both ways
+        User.objects.filter(username='member1').update(is_active=False)
+        Profile.objects.filter(pk=self.members[1].pk).update(communications_opt_in=False)
+        Profile.objects.exclude(pk=self.members[1].pk).update(communications_opt_in=True)
+
+    def bulk(self, action, profiles, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('bulk_update_status'), {
+                'action': action, 'profile_ids[]': [profile.pk for profile in profiles], **data
+            })
+
+    def column(self, lookup):
+        return list(Profile.objects.filter(pk__in=[m.pk for m in self.members]).order_by('pk').values_list(lookup, flat=True))
+
+    def test_toggles_flip_each_selected_row(self):
+        self.assertEqual(self.bulk('toggle_active', self.members[:2]).json()['updated_count'], 2)
+        self.assertEqual(self.column('user__is_active'), [False, True, True])
+
+        self.assertEqual(self.bulk('toggle_communications', self.members[:2]).json()['updated_count'], 2)
+        self.assertEqual(self.column('communications_opt_in'), [False, True, True])
+
+    def test_derived_data_stays_consistent_after_bulk_updates(self):
+        self.assertEqual(get_dashboard_stats()['status_breakdown']['green'], 0)
+        self.bulk('update_status', self.members[:2], new_status='green')
+        self.bulk('toggle_active', self.members)
+        self.bulk('toggle_communications', self.members)
+
+        self.assertEqual(self.column('status'), ['green', 'green', 'pending'])
+        stats = ReferralStats.objects.get(profile=self.referrer)
+        self.assertEqual(stats.as_dict(), ReferralStats.compute([self.referrer.pk])[self.referrer.pk].as_dict())
+        self.assertEqual(stats.active_referrals, 2)
+        for profile in Profile.objects.select_related('user'):
+            self.assertEqual(profile.search_text, profile.build_search_text())
+        self.assertEqual(get_dashboard_stats()['status_breakdown']['green'], 2)
+
+    def test_export_streams_only_the_selected_rows(self):
+        response = self.bulk('export_selected', [self.members[0], self.members[2]])
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual([row[0] for row in rows], ['Username', 'member0', 'member2'])
+
+def table_rows():
+    return {
+        model._meta.db_table: list(
+            model._base_manager.order_by('pk').values_list(*[field.attname for field in dump_fields(model)])
+        )
+        for model in DUMP_MODELS
+    }
+
+class MembersDumpTests(TestCase):
+    def setUp(self):
+        awkward = [('Tab\tbed', 'back\\slash'), ('Multi\nline', '\\N'), ('Zoë', '')]
+        profiles = []
+        for i, (first_name, last_name) in enumerate(awkward):
+            user = User.objects.create_user(
+                f'member{i}', f'member{i}@example.com', 'password', first_name=first_name, last_name=last_name
+            )
+            profiles.append(user.profile)
+        Profile.objects.filter(pk=profiles[0].pk).update(city='Line one\r\nLine two', tacconnector_link=None)
+        with self.captureOnCommitCallbacks(execute=True):
+            Referral.objects.create(referrer=profiles[0], referred=profiles[1])
+            Referral.objects.create(referrer=profiles[1], referred=profiles[2])
+
+        handle, self.path = tempfile.mkstemp(suffix='.sql')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def export(self, *args):
+        call_command('export_members', '--format', 'copy', '--output', self.path, *args, stderr=StringIO())
+
+    def test_copy_export_round_trips_through_load_members(self):
+        self.export('--chunk-size', '2')
+        before = table_rows()
+        paths = set(ReferralPath.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+        stats = {row.profile_id: row.as_dict() for row in ReferralStats.objects.all()}
+        self.assertTrue(stats)
+
+        User.objects.all().delete()
+        self.assertFalse(Profile.objects.exists())
+        call_command('load_members', self.path, '--batch-size', '2', stdout=StringIO())
+
+        self.assertEqual(table_rows(), before)
+        self.assertEqual(set(ReferralPath.objects.values_list('ancestor_id', 'descendant_id', 'depth')), paths)
+        self.assertEqual({row.profile_id: row.as_dict() for row in ReferralStats.objects.all()}, stats)
+        # Sequences moved past the restored ids
+        self.assertGreater(User.objects.create_user('after_restore').pk, max(row[0] for row in before['auth_user']))
+
+    def test_load_refuses_non_empty_tables(self):
+        self.export()
+        with self.assertRaisesMessage(CommandError, 'auth_user is not empty'):
+            call_command('load_members', self.path)
+
+class ExportWorkerTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media_root
+        for i in range(3):
+            User.objects.create_user(f'member{i}', f'member{i}@example.com', 'password')
+
+    def run_worker(self):
+        out, err = StringIO(), StringIO()
+        call_command('run_export_worker', '--once', '--chunk-size', '2', stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def read_artifact(self, job):
+        with open(os.path.join(self.media_root, job.file_path), newline='', encoding='utf-8') as artifact:
+            return artifact.read()
+
+    def test_worker_builds_queued_jobs(self):
+        csv_job = ExportJob.objects.create(format='csv')
+        jsonl_job = ExportJob.objects.create(format='jsonl')
+        self.run_worker()
+
+        for job in (csv_job, jsonl_job):
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.rows_written, job.total_rows, job.progress), ('done', 3, 3, 100))
+        rows = list(csv.reader(StringIO(self.read_artifact(csv_job))))
+        self.assertEqual([row[0] for row in rows], ['Username', 'member0', 'member1', 'member2'])
+        lines = self.read_artifact(jsonl_job).splitlines()
+        self.assertEqual([json.loads(line)['username'] for line in lines], ['member0', 'member1', 'member2'])
+
+    def test_failed_job_records_its_error(self):
+        job = ExportJob.objects.create(format='xml')
+        _, err = self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('Unsupported export format', job.error)
+        self.assertIn('failed', err)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'exports')), [])
+
+    @override_settings(EXPORT_CLAIM_TIMEOUT=30)
+    def test_stale_running_job_is_reclaimed(self):
+        now = timezone.now()
+        stale = ExportJob.objects.create(status='running', started_at=now - timedelta(minutes=31), rows_written=2)
+        live = ExportJob.objects.create(status='running', started_at=now - timedelta(minutes=5))
+        self.run_worker()
+
+        stale.refresh_from_db()
+        live.refresh_from_db()
+        self.assertEqual((stale.status, stale.rows_written), ('done', 3))
+        self.assertEqual(live.status, 'running')
+
+    def test_job_taken_over_by_another_worker_is_discarded(self):
+        job = ExportJob.objects.create(status='running', started_at=timezone.now() - timedelta(hours=1))
+        taken_over = ExportJob.objects.get(pk=job.pk)
+        ExportJob.objects.filter(pk=job.pk).update(started_at=timezone.now())
+
+        self.assertFalse(run_export_job(taken_over))
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).status, 'running')
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'exports')), [])
+
+class RangedFileResponseTests(TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        with os.fdopen(handle, 'wb') as artifact:
+            artifact.write(bytes(range(256)) * 4)
+        self.addCleanup(os.remove, self.path)
+
+    def get(self, header=None):
+        request = RequestFactory().get('/', **({'HTTP_RANGE': header} if header else {}))
+        response = ranged_file_response(request, self.path, 'export.csv', 'text/csv')
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        if hasattr(response, 'close'):
+            response.close()
+        return response, body
+
+    def test_ranges(self):
+        data = bytes(range(256)) * 4
+        for header, status, content_range, body in [
+            (None, 200, None, data),
+            ('bytes=100-199', 206, 'bytes 100-199/1024', data[100:200]),
+            ('bytes=1000-', 206, 'bytes 1000-1023/1024', data[1000:]),
+            ('bytes=1000-5000', 206, 'bytes 1000-1023/1024', data[1000:]),
+            ('bytes=-24', 206, 'bytes 1000-1023/1024', data[1000:]),
+            ('bytes=500-100', 200, None, data),
+            ('bytes=0-1,5-6', 200, None, data),
+            ('bytes=2000-', 416, 'bytes */1024', b''),
+        ]:
+            with self.subTest(header=header):
+                response, content = self.get(header)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response.get('Content-Range'), content_range)
+                self.assertEqual(content, body)
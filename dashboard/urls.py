@@ -17,10 +17,13 @@ urlpatterns = [
     path('qualified-sponsored/', views.qualified_sponsored, name='qualified_sponsored'),
     path('assign/', views.assign_members, name='assign_members'),
     path('export/', views.export_data, name='export_data'),
+    path('export/jobs/<int:job_id>/', views.export_job_status, name='export_job_status'),
+    path('export/jobs/<int:job_id>/download/', views.export_job_download, name='export_job_download'),
     path('override-history/', views.override_history, name='override_history'),  # Add this line
 
     # API and utility endpoints
     path('api/stats/', views.dashboard_stats, name='dashboard_stats'),
+    path('api/users/', views.view_all_users_data, name='view_all_users_data'),
     path('bulk-update-status/', views.bulk_update_status, name='bulk_update_status'),
     path('process-yellow/', views.process_yellow_queue, name='process_yellow_queue'),
 ]
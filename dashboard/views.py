@@ -1,37 +1,52 @@
 # dashboard/views.py - Complete import section
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.admin.views.decorators import staff_member_required
+from django.urls import reverse
+from django.conf import settings
+from django.template.loader import render_to_string
 from django.contrib import messages
 from django.db.models import Q
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.models import User
 from django.db import transaction
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 from django.core.exceptions import PermissionDenied
 from users.models import Profile
+from users.decorators import referrer_prompt_exempt, staff_member_required
+from users.search import search_profiles
 from core.models import Referral, Assignment
 from .forms import (
     AdminUserEditForm,
     AdminProfileEditForm,
     ProfileFilterForm,
+    BulkActionForm,
     UserDeleteForm,
     QualificationOverrideForm
 )
-import csv
+from .bulk import run_bulk_action
+from .dumps import iter_copy_dump
+from .exports import CONTENT_TYPES, available_formats, ranged_file_response
+from .models import ExportJob
+from .pagination import InvalidCursor, KeysetPaginator
+from .stats import aget_dashboard_stats, get_dashboard_stats
 import json
+import os
 from datetime import datetime, timedelta
 
+@referrer_prompt_exempt
 @staff_member_required
 def admin_dashboard(request):
     """Main admin dashboard with statistics"""
     return render(request, 'dashboard/admin_dashboard.html')
 
-@staff_member_required
-def view_all_users(request):
-    """View all users with filtering and override status"""
+USERS_PER_PAGE = 50
+
+def filtered_profiles(request):
+    """Apply the member list filters and keyset pagination; returns (form, page).
+    Raises InvalidCursor for a tampered or stale cursor."""
     form = ProfileFilterForm(request.GET)
-    profiles = Profile.objects.select_related('user', 'overridden_by', 'admin_overridden_by').all()
+    profiles = Profile.objects.select_related('user')
+    sort = 'newest'
 
     if form.is_valid():
         # Apply filters
@@ -51,25 +66,77 @@ def view_all_users(request):
             elif override_status == 'admin_overridden':
                 profiles = profiles.filter(admin_promotion_overridden=True)
 
-        if form.cleaned_data['search']:
-            search_term = form.cleaned_data['search']
-            profiles = profiles.filter(
-                Q(user__first_name__icontains=search_term) |
-                Q(user__last_name__icontains=search_term) |
-                Q(user__email__icontains=search_term) |
-                Q(user__username__icontains=search_term) |
-                Q(phone__icontains=search_term)
-            )
+        search_term = form.cleaned_data['search']
+        if search_term:
+            profiles = search_profiles(profiles, search_term)
+
+        sort = form.cleaned_data.get('sort') or ('relevance' if search_term else sort)
+        if sort == 'relevance' and not search_term:
+            sort = 'newest'
+
+    sort_field, descending = ProfileFilterForm.SORT_OPTIONS[sort]
+    paginator = KeysetPaginator(profiles, sort_field, descending=descending, per_page=USERS_PER_PAGE)
+    return form, paginator.page(request.GET.get('cursor'))
+
+@referrer_prompt_exempt
+@staff_member_required
+def view_all_users(request):
+    """View all users with filtering and override status"""
+    filter_query = request.GET.copy()
+    filter_query.pop('cursor', None)
+
+    try:
+        form, page = filtered_profiles(request)
+    except InvalidCursor:
+        messages.warning(request, 'That page link is no longer valid; showing the first page instead.')
+        return redirect(f"{reverse('view_all_users')}?{filter_query.urlencode()}")
 
     return render(request, 'dashboard/view_all_users.html', {
-        'profiles': profiles,
-        'form': form
+        'profiles': page,
+        'form': form,
+        'filter_query': filter_query.urlencode(),
+        'stats': get_dashboard_stats()
+    })
+
+@referrer_prompt_exempt
+@staff_member_required
+def view_all_users_data(request):
+    """JSON variant of view_all_users for loading further pages lazily"""
+    try:
+        form, page = filtered_profiles(request)
+    except InvalidCursor:
+        # Falling back to the first page would append its rows again
+        return JsonResponse({'error': 'This list is out of date; reload the page.'}, status=400)
+
+    results = [{
+        'id': profile.id,
+        'name': profile.user.get_full_name(),
+        'username': profile.user.username,
+        'email': profile.user.email,
+        'phone': profile.phone,
+        'member_type': profile.member_type,
+        'status': profile.status,
+        'verified_email': profile.verified_email,
+        'registered_tacconnector': profile.registered_tacconnector,
+        'is_active': profile.user.is_active,
+        'is_staff': profile.user.is_staff,
+        'referrer_phone': profile.referrer_phone,
+        'qualification_overridden': profile.qualification_overridden,
+        'admin_promotion_overridden': profile.admin_promotion_overridden,
+        'created_at': profile.created_at.isoformat(),
+    } for profile in page]
+
+    return JsonResponse({
+        'results': results,
+        'rows_html': render_to_string('dashboard/partials/user_rows.html', {'profiles': page}, request=request),
+        'next_cursor': page.next_cursor
     })
 
+@referrer_prompt_exempt
 @staff_member_required
 def edit_user(request, profile_id):
     """Edit user with override functionality"""
-    profile = get_object_or_404(Profile, id=profile_id)
+    profile = get_object_or_404(Profile.objects.select_related('user', 'referral_stats', 'referred_by__user'), id=profile_id)
     user = profile.user
 
     if request.method == 'POST':
@@ -104,13 +171,9 @@ def edit_user(request, profile_id):
                             updated_user.save()
                             messages.info(request, f'Admin promotion override applied - user promoted to staff')
 
-                    # Save the profile
+                    # Save the profile; changed qualification inputs are re-evaluated on save
                     updated_profile.save()
 
-                    # Check qualifications after update (unless overridden)
-                    updated_profile.check_yellow_qualification()
-                    updated_profile.check_sponsored_qualification()
-
                 messages.success(
                     request,
                     f'All information for {updated_user.get_full_name()} has been updated successfully!'
@@ -137,12 +200,7 @@ def edit_user(request, profile_id):
     referrals_made = Referral.objects.filter(referrer=profile).select_related('referred__user')
 
     # Get who referred this user
-    referrer = None
-    if profile.referrer_phone:
-        try:
-            referrer = Profile.objects.get(phone=profile.referrer_phone)
-        except Profile.DoesNotExist:
-            pass
+    referrer = profile.referred_by
 
     # Get override history
     override_history = []
@@ -239,12 +297,9 @@ def remove_override(request, profile_id):
                     profile.override_reason = ''
                     profile.overridden_by = None
                     profile.override_date = None
+                    # Lifting the override re-evaluates qualifications on save
                     profile.save()
 
-                    # Re-check qualifications
-                    profile.check_yellow_qualification()
-                    profile.check_sponsored_qualification()
-
                     messages.success(request, f'Qualification override removed for {profile.user.get_full_name()}')
 
                 elif override_type == 'admin_promotion':
@@ -270,6 +325,7 @@ def remove_override(request, profile_id):
 
     return redirect('edit_user', profile_id=profile.id)
 
+@referrer_prompt_exempt
 @staff_member_required
 def override_history(request):
     """View override history across all users"""
@@ -287,10 +343,11 @@ def override_history(request):
         'admin_overrides': admin_overrides
     })
 
+@referrer_prompt_exempt
 @staff_member_required
 def delete_user(request, profile_id):
     """Delete user with override information in confirmation"""
-    profile = get_object_or_404(Profile, id=profile_id)
+    profile = get_object_or_404(Profile.objects.select_related('user', 'referral_stats', 'referred_by__user'), id=profile_id)
     user = profile.user
 
     if request.method == 'POST':
@@ -342,6 +399,7 @@ def delete_user(request, profile_id):
 
 # Keep existing views with minor updates for override information
 
+@referrer_prompt_exempt
 @staff_member_required
 def paying_queue(request):
     """Paying members queue with override status"""
@@ -354,18 +412,20 @@ def paying_queue(request):
         'profiles': paying_profiles
     })
 
+@referrer_prompt_exempt
 @staff_member_required
 def sponsored_queue(request):
     """Sponsored members queue with override status"""
     sponsored_profiles = Profile.objects.filter(
         member_type='sponsored',
         status='pending'
-    ).select_related('user', 'overridden_by')
+    ).select_related('user', 'overridden_by').with_referral_stats()
 
     return render(request, 'dashboard/sponsored_queue.html', {
         'profiles': sponsored_profiles
     })
 
+@referrer_prompt_exempt
 @staff_member_required
 def yellow_members(request):
     """Yellow members with override status"""
@@ -378,6 +438,7 @@ def yellow_members(request):
         'profiles': yellow_profiles
     })
 
+@referrer_prompt_exempt
 @staff_member_required
 def qualified_sponsored(request):
     """Qualified sponsored members with override status"""
@@ -385,12 +446,13 @@ def qualified_sponsored(request):
         member_type='sponsored',
         status='qualified',
         paid_for_self=False
-    ).select_related('user', 'overridden_by')
+    ).select_related('user', 'overridden_by').with_referral_stats()
 
     return render(request, 'dashboard/qualified_sponsored.html', {
         'profiles': qualified_profiles
     })
 
+@referrer_prompt_exempt
 @staff_member_required
 def assign_members(request):
     """Assign yellow to sponsored members"""
@@ -453,186 +515,107 @@ def assign_members(request):
         'assignments': assignments
     })
 
+@referrer_prompt_exempt
 @staff_member_required
 def export_data(request):
-    """Export data with override information"""
+    """Export data with override information; file formats are built by the export worker"""
     if request.method == 'POST':
         export_type = request.POST.get('export_type', 'csv')
 
-        if export_type == 'csv':
-            response = HttpResponse(content_type='text/csv')
-            response['Content-Disposition'] = 'attachment; filename="wepool_users_with_overrides.csv"'
-
-            writer = csv.writer(response)
-            writer.writerow([
-                'Username', 'Email', 'First Name', 'Last Name', 'Phone',
-                'Member Type', 'Status', 'Referrer Phone', 'Verified Email',
-                'Registered TechConnect', 'TechConnect Link', 'Is Active', 'Is Staff',
-                'Qualification Overridden', 'Override Reason', 'Overridden By',
-                'Admin Promotion Overridden', 'Admin Override Reason', 'Admin Override By',
-                'Created At', 'Updated At'
-            ])
-
-            profiles = Profile.objects.select_related('user', 'overridden_by', 'admin_overridden_by').all()
-            for profile in profiles:
-                writer.writerow([
-                    profile.user.username,
-                    profile.user.email,
-                    profile.user.first_name,
-                    profile.user.last_name,
-                    profile.phone,
-                    profile.member_type,
-                    profile.status,
-                    profile.referrer_phone or '',
-                    profile.verified_email,
-                    profile.registered_techconnect,
-                    profile.techconnect_link or '',
-                    profile.user.is_active,
-                    profile.user.is_staff,
-                    profile.qualification_overridden,
-                    profile.override_reason or '',
-                    profile.overridden_by.username if profile.overridden_by else '',
-                    profile.admin_promotion_overridden,
-                    profile.admin_override_reason or '',
-                    profile.admin_overridden_by.username if profile.admin_overridden_by else '',
-                    profile.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                    profile.updated_at.strftime('%Y-%m-%d %H:%M:%S')
-                ])
-
-            return response
+        if export_type in available_formats():
+            job = ExportJob.objects.create(format=export_type, requested_by=request.user)
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                return JsonResponse(export_job_payload(job), status=202)
+            messages.success(request, f'{job.get_format_display()} export queued. It will appear below when ready.')
+            return redirect('export_data')
 
         elif export_type == 'sql':
-            response = HttpResponse(content_type='text/plain')
-            response['Content-Disposition'] = 'attachment; filename="wepool_users_with_overrides.sql"'
-
-            sql_statements = []
-            profiles = Profile.objects.select_related('user', 'overridden_by', 'admin_overridden_by').all()
+            # The backup carries password hashes, so it is limited to superusers
+            if not request.user.is_superuser:
+                raise PermissionDenied
+            response = StreamingHttpResponse(iter_copy_dump(), content_type='text/plain; charset=utf-8')
+            response['Content-Disposition'] = 'attachment; filename="wepool_members.sql"'
+            return response
 
-            for profile in profiles:
-                sql = f"""INSERT INTO profiles (username, email, first_name, last_name, phone, member_type, status, referrer_phone, verified_email, registered_techconnect, techconnect_link, is_active, is_staff, qualification_overridden, override_reason, overridden_by, admin_promotion_overridden, admin_override_reason, admin_override_by, created_at, updated_at) VALUES ('{profile.user.username}', '{profile.user.email}', '{profile.user.first_name}', '{profile.user.last_name}', '{profile.phone}', '{profile.member_type}', '{profile.status}', '{profile.referrer_phone or "NULL"}', {profile.verified_email}, {profile.registered_techconnect}, '{profile.techconnect_link or "NULL"}', {profile.user.is_active}, {profile.user.is_staff}, {profile.qualification_overridden}, '{profile.override_reason or "NULL"}', '{profile.overridden_by.username if profile.overridden_by else "NULL"}', {profile.admin_promotion_overridden}, '{profile.admin_override_reason or "NULL"}', '{profile.admin_overridden_by.username if profile.admin_overridden_by else "NULL"}', '{profile.created_at}', '{profile.updated_at}');"""
-                sql_statements.append(sql)
+    return render(request, 'dashboard/export_data.html', {
+        'formats': available_formats(),
+        'jobs': ExportJob.objects.select_related('requested_by')[:10]
+    })
 
-            response.write('\n'.join(sql_statements))
-            return response
+def export_job_payload(job):
+    return {
+        'id': job.id,
+        'format': job.format,
+        'status': job.status,
+        'progress': job.progress,
+        'rows_written': job.rows_written,
+        'total_rows': job.total_rows,
+        'error': job.error,
+        'status_url': reverse('export_job_status', args=[job.id]),
+        'download_url': reverse('export_job_download', args=[job.id]) if job.status == 'done' else None
+    }
 
-    return render(request, 'dashboard/export_data.html')
+@referrer_prompt_exempt
+@staff_member_required
+def export_job_status(request, job_id):
+    """Progress of an export job, polled by export_data.html"""
+    job = get_object_or_404(ExportJob, id=job_id)
+    return JsonResponse(export_job_payload(job))
 
+@referrer_prompt_exempt
+@staff_member_required
+def export_job_download(request, job_id):
+    """Serve a finished export artifact, with byte-range support for resumed downloads"""
+    job = get_object_or_404(ExportJob, id=job_id, status='done')
+    path = os.path.join(settings.MEDIA_ROOT, job.file_path)
+    if not os.path.exists(path):
+        raise Http404('Export file no longer exists')
+    return ranged_file_response(request, path, os.path.basename(job.file_path), CONTENT_TYPES[job.format])
+
+@referrer_prompt_exempt
 @staff_member_required
-def dashboard_stats(request):
+async def dashboard_stats(request):
     """API endpoint for dashboard statistics with override information"""
-    from django.db.models import Count, Q
-
-    # Get statistics
-    total_users = Profile.objects.count()
-    paying_members = Profile.objects.filter(member_type='paying').count()
-    sponsored_members = Profile.objects.filter(member_type='sponsored').count()
-
-    # Status counts
-    pending_count = Profile.objects.filter(status='pending').count()
-    yellow_count = Profile.objects.filter(status='yellow').count()
-    green_count = Profile.objects.filter(status='green').count()
-    qualified_count = Profile.objects.filter(status='qualified').count()
-
-    # Override counts
-    qualification_overrides = Profile.objects.filter(qualification_overridden=True).count()
-    admin_overrides = Profile.objects.filter(admin_promotion_overridden=True).count()
-
-    # Recent registrations (last 7 days)
-    last_week = datetime.now() - timedelta(days=7)
-    recent_registrations = Profile.objects.filter(
-        created_at__gte=last_week
-    ).count()
-
-    # Assignment statistics
-    total_assignments = Assignment.objects.filter(completed=True).count()
-    pending_assignments = Assignment.objects.filter(completed=False).count()
-
-    # Active users
-    active_users = Profile.objects.filter(user__is_active=True).count()
-    verified_emails = Profile.objects.filter(verified_email=True).count()
-
-    data = {
-        'total_users': total_users,
-        'paying_members': paying_members,
-        'sponsored_members': sponsored_members,
-        'active_users': active_users,
-        'verified_emails': verified_emails,
-        'status_breakdown': {
-            'pending': pending_count,
-            'yellow': yellow_count,
-            'green': green_count,
-            'qualified': qualified_count
-        },
-        'overrides': {
-            'qualification_overrides': qualification_overrides,
-            'admin_overrides': admin_overrides
-        },
-        'recent_registrations': recent_registrations,
-        'assignments': {
-            'completed': total_assignments,
-            'pending': pending_assignments
-        }
-    }
-
-    return JsonResponse(data)
+    return JsonResponse(await aget_dashboard_stats())
 
+@referrer_prompt_exempt
 @staff_member_required
 @require_http_methods(["POST"])
 def bulk_update_status(request):
     """Bulk update user statuses and other bulk actions"""
-    profile_ids = request.POST.getlist('profile_ids[]')
-    action = request.POST.get('action')
-    new_status = request.POST.get('new_status')
+    data = request.POST.copy()
+    if not data.get('action') and data.get('new_status'):
+        data['action'] = 'update_status'
+
+    try:
+        profile_ids = [int(profile_id) for profile_id in request.POST.getlist('profile_ids[]')]
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid user selection'})
 
     if not profile_ids:
         return JsonResponse({'success': False, 'error': 'No users selected'})
 
-    try:
-        with transaction.atomic():
-            if action == 'toggle_active':
-                # Toggle active status for selected users
-                updated_count = 0
-                for profile_id in profile_ids:
-                    try:
-                        profile = Profile.objects.get(id=profile_id)
-                        profile.user.is_active = not profile.user.is_active
-                        profile.user.save()
-                        updated_count += 1
-                    except Profile.DoesNotExist:
-                        pass
-
-                return JsonResponse({
-                    'success': True,
-                    'updated_count': updated_count
-                })
-
-            elif new_status:
-                # Update status for selected profiles
-                updated_count = Profile.objects.filter(
-                    id__in=profile_ids
-                ).update(status=new_status)
-
-                # Check qualifications for updated profiles (respect overrides)
-                for profile_id in profile_ids:
-                    try:
-                        profile = Profile.objects.get(id=profile_id)
-                        if not profile.qualification_overridden:
-                            profile.check_yellow_qualification()
-                            profile.check_sponsored_qualification()
-                    except Profile.DoesNotExist:
-                        pass
-
-                return JsonResponse({
-                    'success': True,
-                    'updated_count': updated_count
-                })
-
-            else:
-                return JsonResponse({'success': False, 'error': 'No valid action specified'})
+    form = BulkActionForm(data)
+    if not form.is_valid():
+        errors = [error for field_errors in form.errors.values() for error in field_errors]
+        return JsonResponse({'success': False, 'error': ' '.join(errors) or 'No valid action specified'})
+
+    action = form.cleaned_data['action']
+    profiles = Profile.objects.filter(id__in=profile_ids)
 
+    try:
+        result = run_bulk_action(action, profiles, new_status=form.cleaned_data['new_status'])
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+    if action == 'export_selected':
+        return result
+    return JsonResponse({
+        'success': True,
+        'updated_count': result
+    })
+
+@referrer_prompt_exempt
 @staff_member_required
 def process_yellow_queue(request):
     """Process yellow members to check their qualification"""
@@ -662,6 +645,7 @@ def process_yellow_queue(request):
 
 # dashboard/views.py - Add these missing views
 
+@referrer_prompt_exempt
 @staff_member_required
 def create_user(request):
     if request.method == 'POST':
@@ -695,6 +679,7 @@ def create_user(request):
         'creating': True
     })
 
+@referrer_prompt_exempt
 @staff_member_required
 def toggle_admin(request, profile_id):
     profile = get_object_or_404(Profile, id=profile_id)
@@ -120,13 +120,48 @@ else:
 PY
 fi
 
+# In-container workers are a fallback for single-service deployments: they are
+# restarted when they exit, but share the web container's lifetime and resources.
+# In production run them as separate services (see DEPLOYMENT.md) and set
+# RUN_MAILER=false / RUN_EXPORT_WORKER=false here.
+supervise() {
+    while true; do
+        "$@"
+        echo "⚠️  '$*' exited with status $?; restarting in 5s..."
+        sleep 5
+    done
+}
+
+# Drain the outbound email queue next to the web server
+if [ "${RUN_MAILER:-true}" = "true" ]; then
+    echo "📧 Starting email queue worker..."
+    supervise python manage.py send_queued_email &
+fi
+
+# Build queued dashboard exports next to the web server
+if [ "${RUN_EXPORT_WORKER:-true}" = "true" ]; then
+    echo "📦 Starting export worker..."
+    supervise python manage.py run_export_worker &
+fi
+
 # Start the application
-echo "🚀 Starting Gunicorn server on port $PORT..."
+# SERVER_MODE=asgi runs uvicorn workers, which serve the async API views
+# (referral data, referrer checks, dashboard stats) on an event loop
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+  WORKER_ARGS="--worker-class uvicorn_worker.UvicornWorker"
+  APPLICATION=wepool_project.asgi:application
+else
+  WORKER_ARGS=""
+  APPLICATION=wepool_project.wsgi:application
+fi
+
+echo "🚀 Starting Gunicorn server (${SERVER_MODE:-wsgi}) on port $PORT..."
 exec gunicorn \
   --bind 0.0.0.0:$PORT \
   --workers ${GUNICORN_WORKERS:-3} \
+  $WORKER_ARGS \
   --timeout ${GUNICORN_TIMEOUT:-120} \
   --access-logfile - \
   --error-logfile - \
   --log-level ${GUNICORN_LOG_LEVEL:-info} \
-  wepool_project.wsgi:application
\ No newline at end of file
+  $APPLICATION
\ No newline at end of file
@@ -32,7 +32,34 @@ python manage.py collectstatic --noinput
 echo "🗄️  Running database migrations..."
 python manage.py migrate
 
+# In-container workers are a fallback for single-service deployments: they are
+# restarted when they exit, but share the web container's lifetime and resources.
+# In production run them as separate services (see DEPLOYMENT.md) and set
+# RUN_MAILER=false / RUN_EXPORT_WORKER=false here.
+supervise() {
+    while true; do
+        "$@"
+        echo "⚠️  '$*' exited with status $?; restarting in 5s..."
+        sleep 5
+    done
+}
+
+# Drain the outbound email queue next to the web server
+if [ "${RUN_MAILER:-true}" = "true" ]; then
+    echo "📧 Starting email queue worker..."
+    supervise python manage.py send_queued_email &
+fi
+
+# Build queued dashboard exports next to the web server
+if [ "${RUN_EXPORT_WORKER:-true}" = "true" ]; then
+    echo "📦 Starting export worker..."
+    supervise python manage.py run_export_worker &
+fi
+
 # Start the application
-echo "🚀 Starting Gunicorn server..."
+echo "🚀 Starting Gunicorn server (${SERVER_MODE:-wsgi})..."
 echo "🔌 Using port: ${PORT:-8000}"
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+    exec gunicorn --bind 0.0.0.0:${PORT:-8000} --workers 3 --worker-class uvicorn_worker.UvicornWorker --timeout 120 wepool_project.asgi:application
+fi
 exec gunicorn --bind 0.0.0.0:${PORT:-8000} --workers 3 --timeout 120 wepool_project.wsgi:application
\ No newline at end of file
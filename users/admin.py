@@ -1,9 +1,12 @@
 # users/admin.py
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.db.models import Q
 from .models import Profile
+from .search import search_profiles, search_rank
 
 class ProfileInline(admin.StackedInline):
     model = Profile
@@ -73,6 +76,14 @@ class UserAdmin(BaseUserAdmin):
 admin.site.unregister(User)
 admin.site.register(User, UserAdmin)
 
+class RankedChangeList(ChangeList):
+    """Lists search results best match first, unless a column header was clicked"""
+
+    def get_ordering(self, request, queryset):
+        if self.query.strip() and ORDER_VAR not in self.params:
+            return ['-search_rank', '-pk']
+        return super().get_ordering(request, queryset)
+
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = (
@@ -91,7 +102,7 @@ class ProfileAdmin(admin.ModelAdmin):
 
     fieldsets = (
         ('User Information', {
-            'fields': ('user', 'phone', 'referrer_phone', 'member_type', 'status')
+            'fields': ('user', 'phone', 'referrer_phone', 'referred_by', 'member_type', 'status')
         }),
         ('Personal Information', {
             'fields': ('date_of_birth', 'city', 'state', 'country', 'zip_code'),  # Removed 'address'
@@ -128,7 +139,7 @@ class ProfileAdmin(admin.ModelAdmin):
 
     # Make tracking fields read-only
     readonly_fields = (
-        'email_verification_token', 'terms_agreed_date', 'overridden_by', 'override_date',
+        'email_verification_token', 'referred_by', 'terms_agreed_date', 'overridden_by', 'override_date',
         'admin_overridden_by', 'admin_override_date'
     )
 
@@ -170,6 +181,19 @@ class ProfileAdmin(admin.ModelAdmin):
 
         super().save_model(request, obj, form, change)
 
+    def get_search_results(self, request, queryset, search_term):
+        """Use the indexed member search instead of an OR of icontains lookups across joins"""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        matches = search_profiles(Profile.objects.all(), search_term).values('id')
+        queryset = queryset.filter(Q(id__in=matches) | Q(referrer_phone__contains=search_term))
+        # RankedChangeList orders by this unless a column header was clicked
+        return queryset.annotate(search_rank=search_rank(Profile, search_term)), False
+
+    def get_changelist(self, request, **kwargs):
+        return RankedChangeList
+
     def get_queryset(self, request):
         """Optimize queries by selecting related objects"""
         return super().get_queryset(request).select_related(
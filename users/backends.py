@@ -0,0 +1,38 @@
+# users/backends.py
+"""Authentication backend that loads the member profile with the user.
+
+AuthenticationMiddleware resolves request.user through the backend recorded in
+the session, so loading the profile here (one joined query) means the
+middleware, context processors, views and templates all share the same
+Profile instance instead of each fetching it again.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+class ProfileBackend(ModelBackend):
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related('profile').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+def get_request_profile(request):
+    """The signed-in member's profile, or None; loaded at most once per request"""
+    if not hasattr(request, '_profile'):
+        user = getattr(request, 'user', None)
+        profile = None
+        if user is not None and user.is_authenticated:
+            # Cached by ProfileBackend; sessions from other backends fall back to one query
+            profile = getattr(user, 'profile', None)
+        request._profile = profile
+    return request._profile
+
+async def aget_request_profile(request):
+    """get_request_profile for async views and middleware; request.user is loaded
+    in a worker thread once, after which it can be read directly"""
+    if hasattr(request, '_profile'):
+        return request._profile
+    return await sync_to_async(get_request_profile)(request)
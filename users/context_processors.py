@@ -1,16 +1,17 @@
 from django.utils import timezone
+from .backends import get_request_profile
+from .middleware import EMAIL_LOCK_HOURS
 
 def verification_banner(request):
-    if not request.user.is_authenticated:
-        return {}
-    profile = getattr(request.user, 'profile', None)
+    # Memoized by ReferrerPromptMiddleware, so rendering does no queries of its own (sync or ASGI)
+    profile = get_request_profile(request)
     if not profile or profile.verified_email:
         return {}
     created = getattr(profile, 'created_at', None)
     if not created:
         return {}
     elapsed = timezone.now() - created
-    total_hours = 72
+    total_hours = EMAIL_LOCK_HOURS
     hours_used = int(elapsed.total_seconds() // 3600)
     hours_left = max(total_hours - hours_used, 0)
     show = hours_left > 0
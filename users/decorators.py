@@ -0,0 +1,59 @@
+# users/decorators.py
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required as sync_staff_member_required
+from django.contrib.auth.decorators import login_required as sync_login_required
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponseNotAllowed
+from django.shortcuts import resolve_url
+from django.views.decorators.http import require_GET as sync_require_GET
+from .backends import aget_request_profile
+
+def referrer_prompt_exempt(view_func):
+    """Let signed-in members reach the view before they have verified their email or
+    given a referrer phone (see users.middleware.ReferrerPromptMiddleware)"""
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def wrapper(*args, **kwargs):
+            return await view_func(*args, **kwargs)
+    else:
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            return view_func(*args, **kwargs)
+    wrapper.referrer_prompt_exempt = True
+    return wrapper
+
+# Django 4.2's auth decorators only wrap sync views; these pass sync views through to
+# them and check async views after loading request.user off the event loop
+
+def _async_user_passes_test(view_func, test_func, login_url):
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        await aget_request_profile(request)
+        if test_func(request.user):
+            return await view_func(request, *args, **kwargs)
+        return redirect_to_login(request.get_full_path(), resolve_url(login_url))
+    return wrapper
+
+def login_required(view_func):
+    if not iscoroutinefunction(view_func):
+        return sync_login_required(view_func)
+    return _async_user_passes_test(view_func, lambda user: user.is_authenticated, settings.LOGIN_URL)
+
+def staff_member_required(view_func):
+    if not iscoroutinefunction(view_func):
+        return sync_staff_member_required(view_func)
+    return _async_user_passes_test(view_func, lambda user: user.is_active and user.is_staff, 'admin:login')
+
+def require_GET(view_func):
+    if not iscoroutinefunction(view_func):
+        return sync_require_GET(view_func)
+
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return HttpResponseNotAllowed(['GET'])
+        return await view_func(request, *args, **kwargs)
+    return wrapper
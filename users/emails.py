@@ -1,26 +1,148 @@
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+from datetime import timedelta
+
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.urls import reverse
+from django.utils import timezone
+from core.mail import email_template, queue_email, queue_emails
+from .models import JobCheckpoint, Profile
 
+DIGEST_JOB_NAME = "admin_digest"
+
+# Members listed individually in one digest; the rest are summarized by the counts
+DIGEST_LIST_LIMIT = 500
+
+
+VERIFICATION_SUBJECT = "Verify your WePool Tribe account"
+VERIFICATION_TEMPLATE = "emails/verify_email.html"
+SITE_NAME = "WePool Tribe"
+
+
+def verification_text(user, verification_url: str) -> str:
+    return f"Welcome to WePool Tribe, {user.first_name}!\n\nPlease verify your email by clicking this link: {verification_url}\n\nIf you didn't register, you can ignore this email."
 
-def send_verification_email(user, verification_url: str) -> None:
-    subject = "Verify your WePool Tribe account"
-    from_email = getattr(settings, "DEFAULT_FROM_EMAIL", "noreply@wepooltribe.com")
-    to = [user.email]
 
-    context = {
+def queue_verification_email(user, verification_url: str) -> None:
+    from_email = getattr(settings, "DEFAULT_FROM_EMAIL", "noreply@wepooltribe.com")
+    html_content = email_template(VERIFICATION_TEMPLATE).render({
         "user": user,
         "verification_url": verification_url,
-        "site_name": "WePool Tribe",
-    }
-
-    html_content = render_to_string("emails/verify_email.html", context)
-    text_content = f"Welcome to WePool Tribe, {user.first_name}!\n\nPlease verify your email by clicking this link: {verification_url}\n\nIf you didn't register, you can ignore this email."
-
-    try:
-        msg = EmailMultiAlternatives(subject, text_content, from_email, to)
-        msg.attach_alternative(html_content, "text/html")
-        msg.send(fail_silently=True)
-    except Exception:
-        # Fallback/no-op to avoid blocking registration
-        pass
\ No newline at end of file
+        "site_name": SITE_NAME,
+    })
+
+    # Sent by the send_queued_email worker, so registration never waits on SMTP
+    queue_email(
+        VERIFICATION_SUBJECT, verification_text(user, verification_url), [user.email],
+        html_body=html_content, from_email=from_email, kind="verification"
+    )
+
+
+def queue_verification_emails(recipients) -> int:
+    """Queue verification emails for (user, verification_url) pairs, rendered in bulk"""
+    recipients = list(recipients)
+    html_contents = email_template(VERIFICATION_TEMPLATE).render_many(
+        ({"user": user, "verification_url": url} for user, url in recipients),
+        shared={"site_name": SITE_NAME},
+    )
+    return len(queue_emails(
+        (VERIFICATION_SUBJECT, verification_text(user, url), [user.email], html_content, "verification")
+        for (user, url), html_content in zip(recipients, html_contents)
+    ))
+
+
+def verification_url_for(profile) -> str:
+    """Absolute verification link for emails sent outside a request"""
+    return f"{getattr(settings, 'SITE_URL', '').rstrip('/')}{reverse('verify_email', args=[str(profile.email_verification_token)])}"
+
+
+def admin_email() -> str:
+    return getattr(settings, "ADMIN_EMAIL", None) or getattr(settings, "DEFAULT_FROM_EMAIL", "noreply@wepooltribe.com")
+
+
+def notify_admins_of_registration(user, profile) -> None:
+    """One email per registration in "instant" mode; in "digest" mode send_admin_digest reports it later"""
+    if getattr(settings, "ADMIN_NOTIFICATION_MODE", "instant") == "digest":
+        return
+    queue_email(
+        "New User Registration - WePool Tribe",
+        f"A new user has registered: {user.get_full_name()} ({user.email})\nMember Type: {profile.get_member_type_display_ui()}\nPhone: {profile.phone}",
+        [admin_email()],
+        kind="admin_notification",
+    )
+
+
+def queue_admin_digest(profiles, counts, since, until) -> None:
+    """One summary of the registrations in [since, until): counts by member type and a link to each listed member"""
+    site_url = getattr(settings, "SITE_URL", "").rstrip("/")
+    total = sum(counts.values())
+    plural = "s" if total != 1 else ""
+
+    lines = [
+        f"{total} new registration{plural} between {since:%Y-%m-%d %H:%M} and {until:%Y-%m-%d %H:%M} UTC.",
+        "",
+    ]
+    lines += sorted(
+        f"{Profile(member_type=member_type).get_member_type_display_ui()}: {count}"
+        for member_type, count in counts.items()
+    )
+    lines.append("")
+    for profile in profiles.select_related("user").order_by("id")[:DIGEST_LIST_LIMIT]:
+        user = profile.user
+        lines.append(
+            f"- {user.get_full_name() or user.username} ({user.email}), "
+            f"{profile.get_member_type_display_ui()}, {profile.phone}: "
+            f"{site_url}{reverse('edit_user', args=[profile.pk])}"
+        )
+    if total > DIGEST_LIST_LIMIT:
+        lines.append(f"... and {total - DIGEST_LIST_LIMIT} more: {site_url}{reverse('view_all_users')}")
+
+    queue_email(
+        f"{total} New User Registration{plural} - WePool Tribe",
+        "\n".join(lines),
+        [admin_email()],
+        kind="admin_digest",
+    )
+
+
+def queue_due_admin_digest(force: bool = False):
+    """Queue the digest if ADMIN_DIGEST_WINDOW minutes have passed since the last one.
+
+    One JobCheckpoint row per install holds the watermark (the highest profile id
+    reported) and when the last digest went out; it is locked while the digest is
+    queued, so concurrent mailers and send_admin_digest runs cannot both send it.
+    Returns the number of registrations covered, or None when not due.
+    """
+    window = timedelta(minutes=getattr(settings, "ADMIN_DIGEST_WINDOW", 60))
+    with transaction.atomic():
+        checkpoint, _ = JobCheckpoint.objects.select_for_update().get_or_create(job=DIGEST_JOB_NAME)
+        now = timezone.now()
+        last_sent = checkpoint.completed_at
+        if last_sent and not force and now - last_sent < window:
+            return None
+
+        if last_sent:
+            since, last_id = last_sent, checkpoint.last_id
+        else:
+            # First digest: the last window's registrations; everything older counts as reported
+            since = now - window
+            last_id = Profile.objects.filter(created_at__lt=since).aggregate(last_id=Max("id"))["last_id"] or 0
+
+        # Counted in the database: after a long outage there may be far more rows than are listed
+        new_last_id = Profile.objects.filter(id__gt=last_id).aggregate(last_id=Max("id"))["last_id"] or last_id
+        profiles = Profile.objects.filter(id__gt=last_id, id__lte=new_last_id)
+        counts = dict(profiles.order_by().values_list("member_type").annotate(count=Count("id")))
+        total = sum(counts.values())
+
+        # Re-checking the previous send time keeps the run exclusive on backends without row locks (SQLite)
+        claimed = JobCheckpoint.objects.filter(pk=checkpoint.pk, completed_at=last_sent).update(
+            since=since,
+            last_id=new_last_id,
+            processed=total,
+            completed_at=now,
+        )
+        if not claimed:
+            return None
+        if total:
+            queue_admin_digest(profiles, counts, since, now)
+    return total
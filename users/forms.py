@@ -1,8 +1,9 @@
 # users/forms.py
 from django import forms
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
 from django.contrib.auth.models import User
 from django.utils import timezone
+from core.mail import email_template, queue_email
 from .models import Profile
 
 class UserRegistrationForm(UserCreationForm):
@@ -126,8 +127,32 @@ class ProfileUpdateForm(forms.ModelForm):
             'zip_code': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'ZIP/Postal Code'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Members without a referrer are prompted for one (see users.middleware); once set it is fixed
+        if self.instance.referrer_phone:
+            self.fields['referrer_phone'].disabled = True
+            self.fields['referrer_phone'].help_text = 'Your referrer cannot be changed; contact an admin if it is wrong.'
+
     def clean_referrer_phone(self):
         referrer_phone = self.cleaned_data.get('referrer_phone')
         if referrer_phone and not referrer_phone.isdigit():
             raise forms.ValidationError("Referrer phone number must contain only digits.")
+        referrer = Profile.objects.resolve_phone(referrer_phone)
+        if referrer is not None and not self.instance.can_be_referred_by(referrer):
+            raise forms.ValidationError("You cannot be referred by yourself or a member of your own referral network.")
         return referrer_phone
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """Password reset email rendered from the precompiled templates and sent through the outbox"""
+
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        subject = ''.join(email_template(subject_template_name).render(context).splitlines())
+        body = email_template(email_template_name).render(context)
+        html_body = ''
+        if html_email_template_name == email_template_name:
+            html_body = body
+        elif html_email_template_name:
+            html_body = email_template(html_email_template_name).render(context)
+        queue_email(subject, body, [to_email], html_body=html_body, from_email=from_email, kind='password_reset')
@@ -1,39 +1,115 @@
 # Management command for checking qualifications
 
-from django.core.management.base import BaseCommand
-from users.models import Profile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from users.models import JobCheckpoint, Profile
+from users.qualification import QUALIFICATION_RULES, run_qualification_rules
+
+JOB_NAME = 'check_qualifications'
 
 class Command(BaseCommand):
-    help = 'Check and update qualifications for all users'
+    help = 'Consistency sweep: re-apply qualification rules to all users (normally kept current on save)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Profiles per batch; each batch commits in its own transaction'
+        )
+        parser.add_argument(
+            '--since',
+            help='Only profiles updated after this ISO datetime, or "last" for the start of the last completed run'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue the most recent unfinished run from its checkpoint'
+        )
 
     def handle(self, *args, **options):
-        # Check yellow qualifications
-        pending_profiles = Profile.objects.filter(status='pending')
-        yellow_qualified = 0
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
 
-        for profile in pending_profiles:
-            if profile.check_yellow_qualification():
-                yellow_qualified += 1
+        run = self.get_run(options)
+        scope = Profile.objects.all()
+        if run.since:
+            scope = scope.filter(updated_at__gt=run.since)
 
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'Updated {yellow_qualified} profiles to Yellow status'
+        totals = {status: 0 for status, _ in QUALIFICATION_RULES}
+        processed = 0
+        started = time.monotonic()
+
+        while True:
+            batch_ids = list(
+                scope.filter(id__gt=run.last_id).order_by('id').values_list('id', flat=True)[:batch_size]
             )
-        )
+            if not batch_ids:
+                break
 
-        # Check sponsored qualifications
-        sponsored_profiles = Profile.objects.filter(
-            member_type='sponsored',
-            status__in=['pending', 'yellow']
-        )
-        sponsored_qualified = 0
+            with transaction.atomic():
+                results = run_qualification_rules(Profile.objects.filter(id__in=batch_ids))
+                run.last_id = batch_ids[-1]
+                run.processed += len(batch_ids)
+                run.save(update_fields=['last_id', 'processed', 'updated_at'])
+
+            for status, count in results.items():
+                totals[status] += count
+            processed += len(batch_ids)
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'Checked up to profile {run.last_id} ({self.rate(processed, started)})')
 
-        for profile in sponsored_profiles:
-            if profile.check_sponsored_qualification():
-                sponsored_qualified += 1
+        run.completed_at = timezone.now()
+        run.save(update_fields=['completed_at', 'updated_at'])
 
         self.stdout.write(
             self.style.SUCCESS(
-                f'Updated {sponsored_qualified} sponsored members to Qualified status'
+                f'Updated {totals["yellow"]} profiles to Yellow status'
+            )
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Updated {totals["qualified"]} sponsored members to Qualified status'
             )
         )
+        self.stdout.write(f'Checked {processed} profiles ({self.rate(processed, started)})')
+
+    def get_run(self, options):
+        """Load the checkpoint to resume, or start a new one"""
+        if options['resume']:
+            if options['since']:
+                raise CommandError('--resume continues a run with its own --since; do not pass both')
+            run = JobCheckpoint.objects.filter(job=JOB_NAME, completed_at__isnull=True).first()
+            if run is None:
+                raise CommandError('No unfinished run to resume')
+            self.stdout.write(f'Resuming run from profile {run.last_id} ({run.processed} already checked)')
+            return run
+
+        since = None
+        if options['since'] == 'last':
+            last_run = JobCheckpoint.objects.filter(job=JOB_NAME, completed_at__isnull=False).first()
+            if last_run is None:
+                raise CommandError('No completed run to take the watermark from')
+            since = last_run.started_at
+        elif options['since']:
+            try:
+                since = parse_datetime(options['since'])
+            except ValueError:
+                since = None
+            if since is None:
+                raise CommandError(f'Invalid --since value: {options["since"]}')
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        return JobCheckpoint.objects.create(job=JOB_NAME, since=since)
+
+    @staticmethod
+    def rate(processed, started):
+        elapsed = time.monotonic() - started
+        per_second = processed / elapsed if elapsed else 0
+        return f'{elapsed:.1f}s, {per_second:.0f} rows/s'
@@ -0,0 +1,27 @@
+# Management command for the registration digest emailed to ADMIN_EMAIL (ADMIN_NOTIFICATION_MODE = 'digest')
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from users.emails import queue_due_admin_digest
+
+class Command(BaseCommand):
+    help = 'Queue one summary email of the registrations since the last digest, once per ADMIN_DIGEST_WINDOW minutes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Send now even if the window since the last digest has not passed'
+        )
+
+    def handle(self, *args, **options):
+        if getattr(settings, 'ADMIN_NOTIFICATION_MODE', 'instant') != 'digest':
+            # Each registration already emailed the admins as it happened
+            raise CommandError("ADMIN_NOTIFICATION_MODE is not 'digest'; admins are notified per registration")
+        reported = queue_due_admin_digest(force=options['force'])
+        if reported is None:
+            self.stdout.write(f'Last digest was less than {settings.ADMIN_DIGEST_WINDOW} minutes ago; nothing to do')
+        elif reported:
+            self.stdout.write(self.style.SUCCESS(f'Queued a digest of {reported} registration(s)'))
+        else:
+            self.stdout.write('No new registrations since the last digest')
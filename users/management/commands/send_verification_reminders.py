@@ -0,0 +1,41 @@
+# Management command for re-sending verification emails to members who have not verified yet
+
+from django.core.management.base import BaseCommand
+from users.emails import queue_verification_emails, verification_url_for
+from users.models import Profile
+
+class Command(BaseCommand):
+    help = 'Queue a verification reminder for every active member with an unverified email'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Members rendered and queued per batch'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the members who would be reminded'
+        )
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.filter(
+            verified_email=False, user__is_active=True
+        ).exclude(user__email='').select_related('user').order_by('id')
+
+        if options['dry_run']:
+            self.stdout.write(f'{profiles.count()} members would be reminded')
+            return
+
+        queued, batch = 0, []
+        for profile in profiles.iterator(chunk_size=options['batch_size']):
+            batch.append((profile.user, verification_url_for(profile)))
+            if len(batch) >= options['batch_size']:
+                queued += queue_verification_emails(batch)
+                batch = []
+        if batch:
+            queued += queue_verification_emails(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Queued {queued} verification reminders'))
@@ -1,49 +1,75 @@
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.utils import timezone
-import os
+from .backends import aget_request_profile, get_request_profile
+
+# Hard lock after this many hours if the email is not verified
+EMAIL_LOCK_HOURS = 72
+
+# Routes served by views we don't define (django.contrib.auth); our own views
+# declare their exemption with users.decorators.referrer_prompt_exempt
+EXEMPT_URL_NAMES = frozenset({
+    'login', 'logout',
+    'password_reset', 'password_reset_done', 'password_reset_confirm', 'password_reset_complete',
+})
+
+# Pages a member without a referrer phone may still open
+ALLOWED_URL_NAMES = ('update_profile', 'user_dashboard')
 
 class ReferrerPromptMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.lock_after = timedelta(hours=EMAIL_LOCK_HOURS)
+        self.allowed_paths = None
+        if iscoroutinefunction(get_response):
+            # Under ASGI the user is loaded once in a worker thread; the policy itself never queries
+            markcoroutinefunction(self)
+            self.process_view = self.aprocess_view
 
     def __call__(self, request):
-        response = self.get_response(request)
-        return response
+        return self.get_response(request)
+
+    def is_exempt(self, request, view_func):
+        if getattr(view_func, 'referrer_prompt_exempt', False):
+            return True
+        match = request.resolver_match
+        return match is not None and match.url_name in EXEMPT_URL_NAMES
+
+    def get_allowed_paths(self):
+        # Reversed on first use rather than in __init__, when the URLconf may not be importable yet
+        if self.allowed_paths is None:
+            self.allowed_paths = frozenset(reverse(name) for name in ALLOWED_URL_NAMES)
+        return self.allowed_paths
 
     def process_view(self, request, view_func, view_args, view_kwargs):
-        if request.user.is_authenticated:
-            exempt_names = {
-                'update_profile', 'logout', 'login', 'terms', 'about', 'contact',
-                'railway_health_check', 'health_check', 'email_lock', 'verify_email',
-                'password_reset', 'password_reset_done', 'password_reset_confirm', 'password_reset_complete',
-                # Admin dashboard routes
-                'admin_dashboard', 'view_all_users', 'edit_user', 'delete_user', 'toggle_admin', 'create_user',
-                'paying_queue', 'sponsored_queue', 'yellow_members', 'qualified_sponsored', 'assign_members',
-                'export_data', 'override_history', 'dashboard_stats', 'bulk_update_status', 'process_yellow_queue'
-            }
-            try:
-                if request.resolver_match and request.resolver_match.url_name in exempt_names:
-                    return None
-            except Exception:
-                pass
-
-            # Hard lock after 72 hours if email not verified
-            profile = getattr(request.user, 'profile', None)
-            if profile and not profile.verified_email and profile.created_at:
-                hours = (timezone.now() - profile.created_at).total_seconds() / 3600
-                if hours >= 72:
-                    return redirect(reverse('email_lock'))
-
-            # Prompt for referrer phone (admins/superusers exempt)
-            if profile and not profile.referrer_phone:
-                if request.user.is_staff or request.user.is_superuser:
-                    return None
-                current_path = request.path or ''
-                allow_paths = [
-                    reverse('update_profile'),
-                    reverse('user_dashboard'),
-                ]
-                if current_path not in allow_paths:
-                    return redirect(f"{reverse('update_profile')}?need_referrer=1")
-        return None
\ No newline at end of file
+        if self.is_exempt(request, view_func):
+            return None
+        return self.check_profile(request, get_request_profile(request))
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_exempt(request, view_func):
+            return None
+        return self.check_profile(request, await aget_request_profile(request))
+
+    def check_profile(self, request, profile):
+        """The redirect, if any, for a signed-in member; profile is None for anonymous users"""
+        if profile is None:
+            return None
+
+        if not profile.verified_email and profile.created_at:
+            if timezone.now() - profile.created_at >= self.lock_after:
+                return redirect('email_lock')
+
+        # Prompt for referrer phone (admins/superusers exempt)
+        if not profile.referrer_phone:
+            if request.user.is_staff or request.user.is_superuser:
+                return None
+            if request.path not in self.get_allowed_paths():
+                return redirect(f"{reverse('update_profile')}?need_referrer=1")
+        return None
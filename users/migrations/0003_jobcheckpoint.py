@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_profile_middle_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(db_index=True, max_length=100)),
+                ('since', models.DateTimeField(blank=True, help_text='Only rows updated after this watermark are in scope', null=True)),
+                ('last_id', models.BigIntegerField(default=0, help_text='Highest primary key already processed')),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['updated_at', 'id'], name='users_prof_updated_idx'),
+        ),
+    ]
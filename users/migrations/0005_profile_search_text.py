@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:38
+
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+
+def fill_search_text(apps, schema_editor):
+    Profile = apps.get_model('users', 'Profile')
+
+    batch = []
+    for profile in Profile.objects.select_related('user').iterator(chunk_size=2000):
+        user = profile.user
+        parts = (user.first_name, profile.middle_names, user.last_name, user.email, user.username, profile.phone)
+        profile.search_text = ' '.join(' '.join(part.split()) for part in parts if part).lower()
+        batch.append(profile)
+        if len(batch) >= 2000:
+            Profile.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    Profile.objects.bulk_update(batch, ['search_text'])
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS users_prof_search_trgm_idx '
+            'ON users_profile USING gin (search_text gin_trgm_ops)'
+        )
+    elif vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS users_profile_search "
+                "USING fts5(search_text, tokenize='trigram')"
+            )
+        except OperationalError:
+            # SQLite older than 3.34 has no trigram tokenizer; users.search falls back to LIKE
+            return
+        schema_editor.execute(
+            'INSERT INTO users_profile_search (rowid, search_text) SELECT id, search_text FROM users_profile'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS users_prof_search_trgm_idx')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS users_profile_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_profile_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
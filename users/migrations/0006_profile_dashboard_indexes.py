@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_profile_search_text'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['member_type', 'status', 'created_at'], name='users_prof_type_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(condition=models.Q(('paid_for_sponsored', False), ('status', 'yellow')), fields=['created_at'], name='users_prof_yellow_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(condition=models.Q(('qualification_overridden', True)), fields=['override_date'], name='users_prof_qual_override_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(condition=models.Q(('admin_promotion_overridden', True)), fields=['admin_override_date'], name='users_prof_admin_override_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_referrers(apps, schema_editor):
+    Profile = apps.get_model('users', 'Profile')
+    referrer = Profile.objects.filter(phone=models.OuterRef('referrer_phone')).exclude(
+        pk=models.OuterRef('pk')
+    ).values('pk')[:1]
+    Profile.objects.exclude(referrer_phone__isnull=True).exclude(referrer_phone='').update(
+        referred_by=models.Subquery(referrer)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_profile_dashboard_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='referred_by',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='referred_profiles', to='users.profile'),
+        ),
+        migrations.RunPython(link_referrers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:00
+
+from django.db import migrations
+
+
+def single_digest_checkpoint(apps, schema_editor):
+    # The digest keeps one row that workers lock; keep the latest watermark and drop older runs
+    JobCheckpoint = apps.get_model('users', 'JobCheckpoint')
+    rows = JobCheckpoint.objects.filter(job='admin_digest').order_by('-completed_at', '-started_at')
+    latest = rows.filter(completed_at__isnull=False).first()
+    if latest is None:
+        rows.delete()
+        JobCheckpoint.objects.create(job='admin_digest')
+    else:
+        rows.exclude(pk=latest.pk).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_profile_referred_by'),
+    ]
+
+    operations = [
+        migrations.RunPython(single_digest_checkpoint, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,41 @@
 # users/models.py - Update the Profile model to include new fields
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.db.models import DEFERRED, F
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from .signals import profile_changed
 import uuid
 
+class ProfileQuerySet(models.QuerySet):
+    REFERRAL_STAT_FIELDS = ('total_referrals', 'paying_referrals', 'sponsored_referrals', 'active_referrals')
+
+    def with_referral_stats(self):
+        """Annotate direct referral counts from the denormalized counters in one join"""
+        return self.annotate(**{
+            name: Coalesce(F(f'referral_stats__{name}'), 0)
+            for name in self.REFERRAL_STAT_FIELDS
+        })
+
+    def resolve_phone(self, phone):
+        """The profile registered under phone, with its user, or None: one lookup on the unique phone index"""
+        if not phone:
+            return None
+        try:
+            return self.select_related('user').get(phone=phone)
+        except self.model.DoesNotExist:
+            return None
+
+    async def aresolve_phone(self, phone):
+        if not phone:
+            return None
+        try:
+            return await self.select_related('user').aget(phone=phone)
+        except self.model.DoesNotExist:
+            return None
+
 class Profile(models.Model):
     def check_yellow_qualification(self, override_check: bool = False) -> bool:
         if self.qualification_overridden and not override_check:
@@ -55,9 +85,20 @@ class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     phone = models.CharField(max_length=15, unique=True)
     referrer_phone = models.CharField(max_length=15, blank=True, null=True)
+    # The profile referrer_phone resolved to when it was entered (see Profile.save)
+    referred_by = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='referred_profiles'
+    )
     member_type = models.CharField(max_length=10, choices=MEMBER_TYPE_CHOICES)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     middle_names = models.CharField(max_length=200, blank=True)
+    # Lowercased names, email, username and phone, matched by users.search
+    search_text = models.TextField(blank=True, editable=False)
 
     # Personal Information (removed address field)
     date_of_birth = models.DateField(null=True, blank=True)
@@ -131,10 +172,102 @@ class Profile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProfileQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Profile"
         verbose_name_plural = "Profiles"
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the member list, and watermark scans (check_qualifications --since)
+            models.Index(fields=['created_at', 'id'], name='users_prof_created_idx'),
+            models.Index(fields=['updated_at', 'id'], name='users_prof_updated_idx'),
+            models.Index(fields=['phone', 'id'], name='users_prof_phone_idx'),
+            # Dashboard queues, trailing created_at so the default ordering needs no sort step:
+            # paying/sponsored queues and qualified_sponsored (paid_for_self is checked on the few
+            # qualified rows). The yellow queue is a small transient subset, so it gets a partial
+            # index; SQLite's averaged statistics would not pick a (status, paid_for_sponsored) one.
+            models.Index(fields=['member_type', 'status', 'created_at'], name='users_prof_type_status_idx'),
+            models.Index(
+                fields=['created_at'],
+                name='users_prof_yellow_queue_idx',
+                condition=models.Q(status='yellow', paid_for_sponsored=False)
+            ),
+            # Overrides are rare, so only the overridden rows are indexed (in override_history order)
+            models.Index(
+                fields=['override_date'],
+                name='users_prof_qual_override_idx',
+                condition=models.Q(qualification_overridden=True)
+            ),
+            models.Index(
+                fields=['admin_override_date'],
+                name='users_prof_admin_override_idx',
+                condition=models.Q(admin_promotion_overridden=True)
+            ),
+        ]
+
+    # Fields whose changes are announced through users.signals.profile_changed
+    TRACKED_FIELDS = (
+        'member_type', 'status', 'verified_email', 'registered_tacconnector',
+        'tacconnector_link', 'qualification_overridden', 'admin_promotion_overridden', 'search_text',
+        'referrer_phone', 'phone'
+    )
+    # Profile columns that build_search_text() reads (the rest come from the user)
+    SEARCH_FIELDS = frozenset({'middle_names', 'phone'})
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values)
+            if name in cls.TRACKED_FIELDS and value is not DEFERRED
+        }
+        return instance
+
+    def tracked_changes(self) -> frozenset:
+        """Tracked fields whose value differs from the last loaded/saved state"""
+        loaded = getattr(self, '_loaded_values', {})
+        return frozenset(
+            name for name, value in loaded.items()
+            if name in self.__dict__ and self.__dict__[name] != value
+        )
+
+    def build_search_text(self) -> str:
+        user = self.user
+        parts = (user.first_name, self.middle_names, user.last_name, user.email, user.username, self.phone)
+        return ' '.join(' '.join(part.split()) for part in parts if part).lower()
+
+    def can_be_referred_by(self, referrer) -> bool:
+        """False for the profile itself and its own downline, either of which would close a loop in the tree"""
+        if referrer.pk == self.pk:
+            return False
+        return self.pk is None or not self.descendant_paths.filter(descendant=referrer).exists()
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            if self._meta.get_field('user').is_cached(self) or not self.search_text:
+                self.search_text = self.build_search_text()
+        elif self.SEARCH_FIELDS & frozenset(update_fields):
+            # A partial save of a searched column must not leave search_text behind
+            self.search_text = self.build_search_text()
+            update_fields = kwargs['update_fields'] = {*update_fields, 'search_text'}
+        saved = self.TRACKED_FIELDS if update_fields is None else frozenset(update_fields)
+        changed = self.tracked_changes() & frozenset(saved)
+        if 'referrer_phone' in changed or (self._state.adding and self.referrer_phone):
+            referrer = Profile.objects.resolve_phone(self.referrer_phone)
+            self.referred_by = referrer if referrer is None or self.can_be_referred_by(referrer) else None
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'referred_by'}
+        previous = {name: self._loaded_values[name] for name in changed}
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            **getattr(self, '_loaded_values', {}),
+            **{name: self.__dict__[name] for name in self.TRACKED_FIELDS
+               if name in saved and name in self.__dict__},
+        }
+        if changed:
+            profile_changed.send(sender=self.__class__, instance=self, changed=changed, previous=previous)
 
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.phone}"
@@ -159,6 +292,27 @@ class Profile(models.Model):
 
 # Qualification methods are defined on Profile class below
 
+class JobCheckpoint(models.Model):
+    """Progress of a batched maintenance run, so a killed run can resume where it stopped"""
+    job = models.CharField(max_length=100, db_index=True)
+    since = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Only rows updated after this watermark are in scope"
+    )
+    last_id = models.BigIntegerField(default=0, help_text="Highest primary key already processed")
+    processed = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        state = 'completed' if self.completed_at else f'at id {self.last_id}'
+        return f"{self.job} run started {self.started_at:%Y-%m-%d %H:%M} ({state})"
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -173,3 +327,69 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     if hasattr(instance, 'profile'):
         instance.profile.save()
+
+# Incremental qualification: re-evaluate only the profiles whose inputs changed
+
+YELLOW_INPUTS = {'verified_email', 'registered_tacconnector', 'tacconnector_link', 'qualification_overridden'}
+
+@receiver(profile_changed, sender=Profile)
+def requalify_changed_profile(sender, instance, changed, **kwargs):
+    from .qualification import promote, qualified_candidates
+
+    if changed & YELLOW_INPUTS and instance.status == 'pending':
+        instance.check_yellow_qualification()
+
+    if (changed & {'member_type', 'qualification_overridden'} and
+            instance.member_type == 'sponsored' and instance.status in ('pending', 'yellow')):
+        instance.check_sponsored_qualification()
+
+    if 'member_type' in changed:
+        # This profile became or stopped being 'paying': only its referrers are affected
+        promote(qualified_candidates(Profile.objects.filter(referrals_made__referred=instance)), 'qualified')
+
+@receiver(post_save, sender='core.Referral')
+def requalify_referrer(sender, instance, created, **kwargs):
+    from .qualification import promote, qualified_candidates
+
+    if created and instance.referred.member_type == 'paying' and instance.referrer.member_type == 'sponsored':
+        promote(qualified_candidates(Profile.objects.filter(pk=instance.referrer_id)), 'qualified')
+
+# Keep the SQLite full-text index in step with search_text (PostgreSQL indexes the column directly)
+
+@receiver(post_save, sender=Profile)
+def index_new_profile(sender, instance, created, **kwargs):
+    if created:
+        from .search import index_profile
+        index_profile(instance)
+
+@receiver(profile_changed, sender=Profile)
+def reindex_changed_profile(sender, instance, changed, **kwargs):
+    if 'search_text' in changed:
+        from .search import index_profile
+        index_profile(instance)
+
+@receiver(post_delete, sender=Profile)
+def unindex_deleted_profile(sender, instance, **kwargs):
+    from .search import unindex_profile
+    unindex_profile(instance.pk)
+
+# Referrer lookups (users.referrers) cache each phone's owner name and member type
+
+@receiver(profile_changed, sender=Profile)
+def forget_changed_referrer(sender, instance, changed, previous=None, **kwargs):
+    if changed & {'phone', 'member_type'}:
+        from .referrers import referrer_cache
+        referrer_cache.invalidate(instance.phone, (previous or {}).get('phone'))
+
+@receiver(post_delete, sender=Profile)
+def forget_deleted_referrer(sender, instance, **kwargs):
+    from .referrers import referrer_cache
+    referrer_cache.invalidate(instance.phone)
+
+@receiver(post_save, sender=User)
+def forget_renamed_referrer(sender, instance, created, update_fields=None, **kwargs):
+    # Logins only touch last_login; any other save may have changed the name
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    from .referrers import referrer_cache
+    referrer_cache.invalidate_user(instance.pk)
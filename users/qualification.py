@@ -0,0 +1,63 @@
+# users/qualification.py
+"""Set-based qualification rules, applied with one UPDATE per rule"""
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from .models import Profile
+
+PAYING_REFERRALS_TO_QUALIFY = 4
+
+def yellow_candidates(profiles=None):
+    """Pending profiles that meet the Yellow requirements (see Profile.check_yellow_qualification)"""
+    profiles = Profile.objects.all() if profiles is None else profiles
+    return profiles.filter(
+        status='pending',
+        qualification_overridden=False,
+        verified_email=True,
+        registered_tacconnector=True,
+        tacconnector_link__isnull=False,
+    ).exclude(tacconnector_link='')
+
+def qualified_candidates(profiles=None):
+    """Sponsored profiles with enough paying referrals (see Profile.check_sponsored_qualification)"""
+    from core.models import Referral
+
+    profiles = Profile.objects.all() if profiles is None else profiles
+    qualifying_referrers = Referral.objects.filter(
+        referred__member_type='paying'
+    ).values('referrer_id').annotate(
+        paying=Count('id')
+    ).filter(paying__gte=PAYING_REFERRALS_TO_QUALIFY).values('referrer_id')
+
+    return profiles.filter(
+        member_type='sponsored',
+        status__in=['pending', 'yellow'],
+        qualification_overridden=False,
+        id__in=qualifying_referrers,
+    )
+
+QUALIFICATION_RULES = (
+    ('yellow', yellow_candidates),
+    ('qualified', qualified_candidates),
+)
+
+def promote(candidates, status):
+    """Move every candidate to status with a single UPDATE; returns the row count"""
+    from core.models import Referral, ReferralStats
+
+    with transaction.atomic():
+        # .update() bypasses Profile.save(), so refresh the referrers' counters ourselves
+        referrer_ids = set(
+            Referral.objects.filter(referred__in=candidates).values_list('referrer_id', flat=True)
+        )
+        promoted = candidates.update(status=status, updated_at=timezone.now())
+        if promoted and referrer_ids:
+            transaction.on_commit(lambda: ReferralStats.refresh(referrer_ids))
+    return promoted
+
+def run_qualification_rules(profiles=None):
+    """Apply every rule to profiles (default: all) and return the per-rule counts"""
+    return {
+        status: promote(candidates(profiles), status)
+        for status, candidates in QUALIFICATION_RULES
+    }
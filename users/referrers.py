@@ -0,0 +1,147 @@
+# users/referrers.py
+"""Referrer lookups for the registration form's phone check.
+
+check_referrer_exists is public and fires on every referrer phone entry, so it
+is served from a bounded per-process LRU of phone -> referrer summary. Misses
+are cached too, for a shorter time, so typos and guesses are not retried
+against the database. Entries are dropped when a profile's phone or member type
+changes, its user's name changes, or the profile is deleted (see users.models).
+Other processes only see those changes once their copy expires, which the TTLs
+keep short.
+
+Each client gets a token bucket (REFERRER_LOOKUP_BURST lookups, refilled at
+REFERRER_LOOKUP_RATE per second); an empty bucket gets a 429 before the cache
+or database is touched.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from .models import Profile
+
+MAX_PHONE_LENGTH = Profile._meta.get_field('phone').max_length
+
+_MISSING = object()
+
+def get_setting(name, default):
+    return getattr(settings, name, default)
+
+class ReferrerCache:
+    """LRU of phone -> (expires_at, summary or None), plus user id -> phone for name changes"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.phone_of_user = {}
+        self.lock = threading.Lock()
+
+    def get(self, phone):
+        with self.lock:
+            entry = self.entries.get(phone)
+            if entry is None:
+                return _MISSING
+            expires_at, summary = entry
+            if expires_at <= time.monotonic():
+                self._pop(phone)
+                return _MISSING
+            self.entries.move_to_end(phone)
+            return summary
+
+    def set(self, phone, summary, user_id, timeout):
+        with self.lock:
+            self._pop(phone)
+            self.entries[phone] = (time.monotonic() + timeout, summary)
+            if user_id is not None:
+                self.phone_of_user[user_id] = phone
+            while len(self.entries) > self.max_entries:
+                self._pop(next(iter(self.entries)))
+
+    def _pop(self, phone):
+        entry = self.entries.pop(phone, None)
+        if entry is not None and entry[1] is not None:
+            self.phone_of_user.pop(entry[1]['user_id'], None)
+
+    def invalidate(self, *phones):
+        with self.lock:
+            for phone in phones:
+                if phone:
+                    self._pop(phone)
+
+    def invalidate_user(self, user_id):
+        with self.lock:
+            phone = self.phone_of_user.get(user_id)
+            if phone is not None:
+                self._pop(phone)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.phone_of_user.clear()
+
+class TokenBuckets:
+    """Per-client token buckets; the least recently seen clients are forgotten beyond max_clients"""
+
+    def __init__(self, max_clients):
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, client, rate, burst):
+        """Spend one token; returns 0 if allowed, else the seconds until a token is available"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated_at = self.buckets.pop(client, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+            self.buckets[client] = (tokens, now)
+            while len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        return wait
+
+referrer_cache = ReferrerCache(get_setting('REFERRER_CACHE_SIZE', 10000))
+lookup_buckets = TokenBuckets(get_setting('REFERRER_LOOKUP_CLIENTS', 10000))
+
+def client_address(request):
+    """The client IP, taken from X-Forwarded-For as appended by TRUSTED_PROXY_COUNT proxies"""
+    proxies = get_setting('TRUSTED_PROXY_COUNT', 0)
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(',')]
+        # Entries left of the ones our proxies appended are client-supplied and can be forged
+        return hops[-proxies] if len(hops) >= proxies else hops[0]
+    return request.META.get('REMOTE_ADDR', '')
+
+def throttle(request):
+    """Seconds the client must wait before its next lookup, or 0"""
+    return lookup_buckets.take(
+        client_address(request),
+        get_setting('REFERRER_LOOKUP_RATE', 1.0),
+        get_setting('REFERRER_LOOKUP_BURST', 10),
+    )
+
+def summarize(profile):
+    if profile is None:
+        return None
+    return {
+        'user_id': profile.user_id,
+        'name': profile.user.get_full_name(),
+        'member_type': profile.member_type,
+    }
+
+async def alookup_referrer(phone):
+    """{'user_id', 'name', 'member_type'} for the profile registered under phone, or None"""
+    phone = (phone or '').strip()
+    if not phone.isdigit() or len(phone) > MAX_PHONE_LENGTH:
+        return None
+
+    summary = referrer_cache.get(phone)
+    if summary is _MISSING:
+        summary = summarize(await Profile.objects.aresolve_phone(phone))
+        timeout = get_setting('REFERRER_CACHE_TIMEOUT', 300) if summary else get_setting('REFERRER_MISS_TIMEOUT', 30)
+        referrer_cache.set(phone, summary, summary and summary['user_id'], timeout)
+    return summary
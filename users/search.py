@@ -0,0 +1,135 @@
+# users/search.py
+"""Member search over the denormalized Profile.search_text column.
+
+PostgreSQL matches with LIKE served by a pg_trgm GIN index and ranks by
+word_similarity(); SQLite matches against an FTS5 trigram shadow table
+(users_profile_search) and ranks by bm25. Ranks are scaled to integers so
+relevance-ordered pages can be keyset paginated. Every word of the term must
+appear as a substring, as with the old icontains search.
+"""
+from django.db import connection
+from django.db.models import F, FloatField, Func, IntegerField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Coalesce
+
+FTS_TABLE = 'users_profile_search'
+
+# Trigram indexes cannot match fewer than three characters
+MIN_INDEXED_TERM = 3
+
+# Ranks are scaled, then truncated to integers: word_similarity() lies in [0, 1], while
+# FTS5 floors a common word's weight at 1e-6, leaving bm25 ranks that differ only far down
+SIMILARITY_SCALE = 10 ** 6
+BM25_SCALE = 10 ** 12
+
+_fts_available = {}
+
+
+def sqlite_fts_available():
+    """Whether the FTS5 shadow table exists (it is skipped when SQLite lacks the trigram tokenizer)"""
+    if connection.alias not in _fts_available:
+        _fts_available[connection.alias] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_available[connection.alias]
+
+
+def _fts_match(words):
+    """FTS5 MATCH expression for the indexable words, or None when the FTS table cannot serve the search"""
+    indexed = [word for word in words if len(word) >= MIN_INDEXED_TERM]
+    if not (indexed and connection.vendor == 'sqlite' and sqlite_fts_available()):
+        return None
+    return ' AND '.join('"{}"'.format(word.replace('"', '""')) for word in indexed)
+
+
+def search_rank(model, term):
+    """Relevance of each row to term as an integer, higher first (0 where the row does not match).
+
+    Scaled and truncated so keyset cursors compare exactly: a float rank recomputed
+    by the next page's query need not equal the value carried in the cursor.
+    """
+    words = term.lower().split()
+    if connection.vendor == 'postgresql':
+        similarity = Func(Value(' '.join(words)), F('search_text'), function='word_similarity', output_field=FloatField())
+        return Cast(similarity * SIMILARITY_SCALE, IntegerField())
+
+    match = _fts_match(words)
+    if match is None:
+        return Value(0, output_field=IntegerField())
+    table = connection.ops.quote_name(model._meta.db_table)
+    return Coalesce(
+        RawSQL(
+            f'SELECT CAST(-rank * {BM25_SCALE} AS INTEGER) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id',
+            [match],
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def search_profiles(queryset, term):
+    """Filter queryset to profiles containing every word of term, annotated with a descending search_rank"""
+    words = term.lower().split()
+    if not words:
+        return queryset.none()
+
+    match = None if connection.vendor == 'postgresql' else _fts_match(words)
+    if match is not None:
+        queryset = queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        )
+    for word in words:
+        # Words too short for the trigram table are still matched, as substrings of search_text
+        if match is None or len(word) < MIN_INDEXED_TERM:
+            queryset = queryset.filter(search_text__contains=word)
+    return queryset.annotate(search_rank=search_rank(queryset.model, term))
+
+
+def refresh_search_text(profiles, batch_size=2000):
+    """Recompute search_text for a Profile queryset whose names, email or phone were changed
+    without Profile.save() (.update(), bulk_create); returns the number of rows corrected"""
+    refreshed, stale = 0, []
+    for profile in profiles.select_related('user').iterator(chunk_size=batch_size):
+        search_text = profile.build_search_text()
+        if profile.search_text != search_text:
+            profile.search_text = search_text
+            stale.append(profile)
+        if len(stale) >= batch_size:
+            refreshed += _save_search_text(stale)
+            stale = []
+    return refreshed + _save_search_text(stale)
+
+
+def _save_search_text(profiles):
+    if profiles:
+        type(profiles[0]).objects.bulk_update(profiles, ['search_text'])
+        for profile in profiles:
+            index_profile(profile)
+    return len(profiles)
+
+
+def index_profile(profile):
+    """Mirror a profile's search_text into the SQLite FTS table"""
+    if connection.vendor != 'sqlite' or not sqlite_fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [profile.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, search_text) VALUES (%s, %s)',
+            [profile.pk, profile.search_text]
+        )
+
+
+def unindex_profile(profile_id):
+    if connection.vendor != 'sqlite' or not sqlite_fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [profile_id])
+
+
+def rebuild_search_index():
+    """Refill the SQLite FTS table from search_text, e.g. after rows were bulk loaded"""
+    if connection.vendor != 'sqlite' or not sqlite_fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, search_text) SELECT id, search_text FROM users_profile')
@@ -0,0 +1,7 @@
+# users/signals.py
+from django.dispatch import Signal
+
+# Sent after a Profile save that changed any of Profile.TRACKED_FIELDS.
+# Receivers get ``instance``, ``changed`` (a frozenset of field names) and
+# ``previous`` (the changed fields' values before the save).
+profile_changed = Signal()
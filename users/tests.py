@@ -1,3 +1,396 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .emails import queue_due_admin_digest
+from .models import JobCheckpoint, Profile
+from .qualification import promote, run_qualification_rules, yellow_candidates
+from .referrers import lookup_buckets, referrer_cache
+from .search import refresh_search_text, search_profiles
+
+def make_profile(username, member_type='paying'):
+    user = User.objects.create_user(username, f'{username}@example.com', 'password')
+    if user.profile.member_type != member_type:
+        Profile.objects.filter(pk=user.profile.pk).update(member_type=member_type)
+    return Profile.objects.get(pk=user.profile.pk)
+
+def make_yellow_ready(profiles, **extra):
+    # .update() skips the on-save re-evaluation, leaving the sweep something to do
+    Profile.objects.filter(pk__in=[profile.pk for profile in profiles]).update(
+        verified_email=True, registered_tacconnector=True, tacconnector_link='https://example.com/tac', **extra
+    )
+
+def statuses(*profiles):
+    return list(Profile.objects.filter(pk__in=[p.pk for p in profiles]).order_by('pk').values_list('status', flat=True))
+
+class QualificationRuleTests(TestCase):
+    def test_yellow_rule_skips_overridden_profiles(self):
+        ready, overridden, incomplete = make_profile('ready'), make_profile('overridden'), make_profile('incomplete')
+        make_yellow_ready([ready])
+        make_yellow_ready([overridden], qualification_overridden=True)
+
+        self.assertEqual(promote(yellow_candidates(), 'yellow'), 1)
+        self.assertEqual(statuses(ready, overridden, incomplete), ['yellow', 'pending', 'pending'])
+
+    def test_qualified_rule_needs_four_paying_referrals_and_no_override(self):
+        from core.models import Referral
+
+        sponsored, overridden = make_profile('sponsored', 'sponsored'), make_profile('overridden', 'sponsored')
+        for referrer in (sponsored, overridden):
+            for i in range(4):
+                Referral.objects.create(referrer=referrer, referred=make_profile(f'{referrer.user.username}{i}'))
+        # Undo the promotion made as the referrals were saved, so the rule has work to do
+        Profile.objects.filter(pk=sponsored.pk).update(status='yellow')
+        Profile.objects.filter(pk=overridden.pk).update(status='yellow', qualification_overridden=True)
+
+        self.assertEqual(run_qualification_rules()['qualified'], 1)
+        self.assertEqual(statuses(sponsored, overridden), ['qualified', 'yellow'])
+
+class CheckQualificationsCommandTests(TestCase):
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('check_qualifications', *args, stdout=out)
+        return out.getvalue()
+
+    def test_batches_cover_every_profile(self):
+        profiles = [make_profile(f'member{i}') for i in range(5)]
+        make_yellow_ready(profiles)
+
+        output = self.run_command('--batch-size', '2')
+
+        self.assertIn('Updated 5 profiles to Yellow status', output)
+        run = JobCheckpoint.objects.get(job='check_qualifications')
+        self.assertEqual((run.processed, run.last_id), (5, profiles[-1].pk))
+        self.assertIsNotNone(run.completed_at)
+
+    def test_resume_continues_after_the_checkpoint(self):
+        profiles = [make_profile(f'member{i}') for i in range(4)]
+        make_yellow_ready(profiles)
+        JobCheckpoint.objects.create(job='check_qualifications', last_id=profiles[1].pk, processed=2)
+
+        output = self.run_command('--resume', '--batch-size', '1')
+
+        self.assertIn('Updated 2 profiles to Yellow status', output)
+        self.assertEqual(statuses(*profiles), ['pending', 'pending', 'yellow', 'yellow'])
+        run = JobCheckpoint.objects.get(job='check_qualifications')
+        self.assertEqual(run.processed, 4)
+        self.assertIsNotNone(run.completed_at)
+
+    def test_resume_without_unfinished_run(self):
+        with self.assertRaisesMessage(CommandError, 'No unfinished run to resume'):
+            self.run_command('--resume')
+
+    def test_resume_rejects_since(self):
+        JobCheckpoint.objects.create(job='check_qualifications')
+        with self.assertRaisesMessage(CommandError, 'do not pass both'):
+            self.run_command('--resume', '--since', 'last')
+
+    def test_invalid_since(self):
+        for value in ('yesterday', '2024-13-01T00:00'):
+            with self.assertRaisesMessage(CommandError, 'Invalid --since value'):
+                self.run_command('--since', value)
+
+@override_settings(REFERRER_LOOKUP_BURST=2, REFERRER_LOOKUP_RATE=0.5, TRUSTED_PROXY_COUNT=0)
+class CheckReferrerTests(TestCase):
+    def setUp(self):
+        referrer_cache.clear()
+        lookup_buckets.buckets.clear()
+        self.addCleanup(referrer_cache.clear)
+        self.addCleanup(lookup_buckets.buckets.clear)
+
+        self.referrer = make_profile('referrer', 'sponsored')
+        self.referrer.user.first_name, self.referrer.user.last_name = 'Ada', 'Lovelace'
+        self.referrer.user.save()
+        self.referrer.phone = '5550100'
+        self.referrer.save()
+
+    def check(self, phone, address='10.0.0.1', **extra):
+        return self.client.get(reverse('check_referrer'), {'phone': phone}, REMOTE_ADDR=address, **extra)
+
+    def test_known_and_unknown_phones(self):
+        self.assertEqual(self.check('5550100').json(), {'exists': True, 'name': 'Ada Lovelace', 'member_type': 'sponsored'})
+        self.assertEqual(self.check('5550199').json(), {'exists': False})
+
+    def test_client_over_its_burst_gets_429_with_retry_after(self):
+        for _ in range(2):
+            self.assertEqual(self.check('5550100').status_code, 200)
+
+        response = self.check('5550100')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(response.json(), {'exists': False, 'throttled': True})
+
+        # Buckets are per client
+        self.assertEqual(self.check('5550100', address='10.0.0.2').status_code, 200)
+
+    @override_settings(TRUSTED_PROXY_COUNT=1)
+    def test_forged_forwarded_for_entries_share_the_proxy_seen_address(self):
+        for forged in ('1.1.1.1', '2.2.2.2'):
+            self.check('5550100', HTTP_X_FORWARDED_FOR=f'{forged}, 203.0.113.9')
+        self.assertEqual(self.check('5550100', HTTP_X_FORWARDED_FOR='3.3.3.3, 203.0.113.9').status_code, 429)
+
+    def test_cached_summary_is_dropped_when_the_referrer_changes(self):
+        self.check('5550100')
+        self.referrer.user.first_name = 'Grace'
+        self.referrer.user.save()
+        self.assertEqual(self.check('5550100', address='10.0.0.2').json()['name'], 'Grace Lovelace')
+
+        self.referrer.phone = '5550111'
+        self.referrer.save()
+        self.assertEqual(self.check('5550100', address='10.0.0.3').json(), {'exists': False})
+
+@override_settings(ADMIN_NOTIFICATION_MODE='digest', ADMIN_DIGEST_WINDOW=60)
+class AdminDigestTests(TestCase):
+    def digests(self):
+        from core.models import OutboundEmail
+        return list(OutboundEmail.objects.filter(kind='admin_digest').values_list('subject', flat=True))
+
+    def expire_window(self):
+        JobCheckpoint.objects.filter(job='admin_digest').update(
+            completed_at=timezone.now() - timedelta(minutes=61)
+        )
+
+    def test_one_digest_per_window_on_a_single_checkpoint(self):
+        make_profile('first')
+        self.assertEqual(queue_due_admin_digest(), 1)
+        self.assertIsNone(queue_due_admin_digest())
+
+        make_profile('second')
+        make_profile('third')
+        self.expire_window()
+        self.assertEqual(queue_due_admin_digest(), 2)
+
+        self.assertEqual(self.digests(), ['2 New User Registrations - WePool Tribe', '1 New User Registration - WePool Tribe'])
+        self.assertEqual(JobCheckpoint.objects.filter(job='admin_digest').count(), 1)
+
+    def test_empty_window_advances_the_checkpoint_without_email(self):
+        queue_due_admin_digest()
+        self.expire_window()
+        self.assertEqual(queue_due_admin_digest(), 0)
+
+        checkpoint = JobCheckpoint.objects.get(job='admin_digest')
+        self.assertLess(timezone.now() - checkpoint.completed_at, timedelta(minutes=1))
+        self.assertEqual(self.digests(), [])
+
+    def test_digest_counts_every_registration_but_lists_only_the_limit(self):
+        from core.models import OutboundEmail
+
+        queue_due_admin_digest()
+        for i in range(3):
+            make_profile(f'paying{i}')
+        make_profile('sponsored', 'sponsored')
+        self.expire_window()
+
+        with mock.patch('users.emails.DIGEST_LIST_LIMIT', 2):
+            self.assertEqual(queue_due_admin_digest(), 4)
+        body = OutboundEmail.objects.get(kind='admin_digest').body
+        self.assertIn('PIF Member: 1\nPaying Member: 3', body)
+        self.assertEqual(body.count('\n- '), 2)
+        self.assertIn('... and 2 more', body)
+        self.assertEqual(JobCheckpoint.objects.get(job='admin_digest').processed, 4)
+
+    @override_settings(ADMIN_NOTIFICATION_MODE='instant')
+    def test_command_refuses_to_run_in_instant_mode(self):
+        make_profile('first')
+        with self.assertRaisesMessage(CommandError, "ADMIN_NOTIFICATION_MODE is not 'digest'"):
+            call_command('send_admin_digest', '--force', stdout=StringIO())
+        self.assertEqual(self.digests(), [])
+
+class MemberSearchTests(TestCase):
+    def setUp(self):
+        # Varying numbers of 'smith' trigrams, so the ranks differ
+        for username, last_name in [('one', 'Smith'), ('two', 'Smithson'), ('three', 'Smith-Smith'),
+                                    ('four', 'Jones'), ('five', 'Smith Smithers'), ('six', 'Smith')]:
+            User.objects.create_user(username, f'{username}@example.com', 'password', last_name=last_name)
+
+    def test_relevance_pages_visit_every_match_once(self):
+        from dashboard.pagination import KeysetPaginator
+
+        matches = search_profiles(Profile.objects.all(), 'smith')
+        ranks = list(matches.values_list('search_rank', flat=True))
+        self.assertTrue(all(isinstance(rank, int) for rank in ranks))
+        self.assertGreater(len(set(ranks)), 1)
+
+        paginator = KeysetPaginator(matches, 'search_rank', descending=True, per_page=2)
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            seen += [profile.user.username for profile in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        expected = list(matches.order_by('-search_rank', '-id').values_list('user__username', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertCountEqual(seen, ['one', 'two', 'three', 'five', 'six'])
+
+    def test_admin_lists_best_matches_first(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        url = reverse('admin:users_profile_changelist')
+
+        results = list(self.client.get(url, {'q': 'smith'}).context['cl'].result_list)
+        self.assertEqual([profile.search_rank for profile in results],
+                         sorted((profile.search_rank for profile in results), reverse=True))
+        self.assertCountEqual([profile.user.username for profile in results], ['one', 'two', 'three', 'five', 'six'])
+
+        # A clicked column still wins (column 2, after the action checkbox and user, is phone)
+        results = list(self.client.get(url, {'q': 'smith', 'o': '2'}).context['cl'].result_list)
+        self.assertEqual([profile.phone for profile in results], sorted(profile.phone for profile in results))
+
+    def test_partial_save_of_the_phone_refreshes_search_text(self):
+        profile = Profile.objects.get(user__username='four')
+        profile.phone = '5550177'
+        profile.save(update_fields=['phone'])
+        self.assertEqual(list(search_profiles(Profile.objects.all(), '5550177')), [profile])
+
+    def test_refresh_after_update_bypassing_save(self):
+        User.objects.filter(username='four').update(last_name='Smithfield')
+        self.assertFalse(search_profiles(Profile.objects.filter(user__username='four'), 'smithfield').exists())
+
+        self.assertEqual(refresh_search_text(Profile.objects.all()), 1)
+        self.assertEqual(refresh_search_text(Profile.objects.all()), 0)
+        self.assertTrue(search_profiles(Profile.objects.filter(user__username='four'), 'smithfield').exists())
+
+def registration_data(username, phone, referrer_phone=''):
+    return {
+        'username': username, 'email': f'{username}@example.com', 'first_name': username.title(),
+        'last_name': 'Member', 'password1': 'a-Long-passw0rd', 'password2': 'a-Long-passw0rd',
+        'phone': phone, 'referrer_phone': referrer_phone, 'member_type': 'paying', 'agreed_to_terms': 'on',
+    }
+
+@override_settings(ADMIN_NOTIFICATION_MODE='instant')
+class RegistrationTests(TestCase):
+    def test_registration_links_the_referrer_and_queues_emails(self):
+        from core.models import OutboundEmail, Referral
+
+        referrer = make_profile('referrer')
+        Profile.objects.filter(pk=referrer.pk).update(phone='5550100')
+        response = self.client.post(reverse('register'), registration_data('newbie', '5550123', '5550100'))
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+
+        newbie = Profile.objects.get(user__username='newbie')
+        self.assertEqual(newbie.referred_by_id, referrer.pk)
+        self.assertTrue(Referral.objects.filter(referrer=referrer, referred=newbie).exists())
+        self.assertEqual(
+            sorted(OutboundEmail.objects.values_list('kind', flat=True)), ['admin_notification', 'verification']
+        )
+
+    def test_outbox_failure_is_not_swallowed(self):
+        with mock.patch('users.views.queue_verification_email', side_effect=DatabaseError('outbox unavailable')):
+            with self.assertRaises(DatabaseError), self.assertLogs('django.request', 'ERROR'):
+                self.client.post(reverse('register'), registration_data('newbie', '5550123'))
+        self.assertFalse(User.objects.filter(username='newbie').exists())
+
+class ReferrerChangeTests(TestCase):
+    def setUp(self):
+        from core.models import Referral
+
+        self.old, self.new = make_profile('old'), make_profile('new')
+        self.member, self.downline = make_profile('member'), make_profile('downline')
+        for profile, phone in [(self.old, '5550001'), (self.new, '5550002'), (self.downline, '5550004')]:
+            Profile.objects.filter(pk=profile.pk).update(phone=phone)
+        with self.captureOnCommitCallbacks(execute=True):
+            Referral.objects.create(referrer=self.member, referred=self.downline)
+
+    def paths(self):
+        from core.models import ReferralPath
+        return set(ReferralPath.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def set_referrer(self, profile, phone):
+        profile = Profile.objects.get(pk=profile.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.referrer_phone = phone
+            profile.save()
+        return profile
+
+    def test_changing_referrer_phone_moves_the_referral_and_its_paths(self):
+        from core.models import Referral, ReferralStats
+
+        self.set_referrer(self.member, '5550001')
+        self.assertEqual(self.paths(), {
+            (self.member.pk, self.downline.pk, 1), (self.old.pk, self.member.pk, 1), (self.old.pk, self.downline.pk, 2)
+        })
+
+        member = self.set_referrer(self.member, '5550002')
+        self.assertEqual(member.referred_by_id, self.new.pk)
+        self.assertEqual(list(Referral.objects.filter(referred=member).values_list('referrer_id', flat=True)), [self.new.pk])
+        self.assertEqual(self.paths(), {
+            (self.member.pk, self.downline.pk, 1), (self.new.pk, self.member.pk, 1), (self.new.pk, self.downline.pk, 2)
+        })
+        self.assertEqual(ReferralStats.objects.get(profile=self.new).level_2, 1)
+        self.assertFalse(ReferralStats.objects.filter(profile=self.old, total_referrals__gt=0).exists())
+
+    def test_referrer_from_own_downline_is_not_linked(self):
+        member = self.set_referrer(self.member, '5550004')
+        self.assertIsNone(member.referred_by_id)
+        self.assertEqual(self.paths(), {(self.member.pk, self.downline.pk, 1)})
+
+    def test_members_set_their_referrer_once(self):
+        from core.models import Referral
+
+        self.client.force_login(self.member.user)
+        data = {'phone': self.member.phone, 'referrer_phone': '5550004', 'communications_opt_in': 'on'}
+        response = self.client.post(reverse('update_profile'), data)
+        self.assertContains(response, 'your own referral network')
+
+        data['referrer_phone'] = '5550001'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertRedirects(self.client.post(reverse('update_profile'), data), reverse('user_dashboard'),
+                                 fetch_redirect_response=False)
+        self.assertTrue(Referral.objects.filter(referrer=self.old, referred=self.member).exists())
+
+        # Once set, the field is disabled and a posted value is ignored
+        data['referrer_phone'] = '5550002'
+        self.client.post(reverse('update_profile'), data)
+        self.assertEqual(Profile.objects.get(pk=self.member.pk).referred_by_id, self.old.pk)
+
+class OutboxEmailTests(TestCase):
+    def outbox(self, kind):
+        from core.models import OutboundEmail
+        return list(OutboundEmail.objects.filter(kind=kind).order_by('id'))
+
+    def test_password_reset_is_queued_not_sent(self):
+        from django.core import mail
+
+        make_profile('member')
+        response = self.client.post(reverse('password_reset'), {'email': 'member@example.com'})
+        self.assertRedirects(response, reverse('password_reset_done'), fetch_redirect_response=False)
+
+        self.assertEqual(mail.outbox, [])
+        [email] = self.outbox('password_reset')
+        self.assertEqual(email.to, ['member@example.com'])
+        self.assertEqual(email.subject, 'WePool Tribe: Password reset request')
+        self.assertEqual(email.html_body, email.body)
+        self.assertIn('Hi member,', email.body)
+        self.assertIn('/password-reset-confirm/', email.body)
+
+    def test_unknown_address_queues_nothing(self):
+        self.client.post(reverse('password_reset'), {'email': 'nobody@example.com'})
+        self.assertEqual(self.outbox('password_reset'), [])
+
+    def test_verification_reminders_go_to_unverified_active_members(self):
+        due = [make_profile(f'due{i}') for i in range(3)]
+        Profile.objects.filter(pk=make_profile('verified').pk).update(verified_email=True)
+        User.objects.filter(username=make_profile('inactive').user.username).update(is_active=False)
+        User.objects.filter(username=make_profile('no_email').user.username).update(email='')
+
+        out = StringIO()
+        call_command('send_verification_reminders', '--dry-run', stdout=out)
+        self.assertIn('3 members would be reminded', out.getvalue())
+        self.assertEqual(self.outbox('verification'), [])
+
+        call_command('send_verification_reminders', '--batch-size', '2', stdout=out)
+        self.assertIn('Queued 3 verification reminders', out.getvalue())
+        emails = self.outbox('verification')
+        self.assertEqual([email.to for email in emails], [[profile.user.email] for profile in due])
+        for email, profile in zip(emails, due):
+            self.assertIn(str(profile.email_verification_token), email.html_body)
+            self.assertIn(str(profile.email_verification_token), email.body)
@@ -2,6 +2,7 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from . import views
+from .forms import QueuedPasswordResetForm
 
 urlpatterns = [
     path('', views.landing_page, name='landing_page'),
@@ -22,6 +23,7 @@ urlpatterns = [
     path('password-reset/',
          auth_views.PasswordResetView.as_view(
              template_name='users/password_reset.html',
+             form_class=QueuedPasswordResetForm,
              email_template_name='emails/password_reset_email.html',
              html_email_template_name='emails/password_reset_email.html',
              subject_template_name='emails/password_reset_subject.txt'
@@ -1,20 +1,26 @@
 # users/views.py
+import math
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
 from django.contrib.auth import login
-from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.conf import settings
 from django.conf import settings as dj_settings
 DEFAULT_FROM_EMAIL = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@wepooltribe.com')
 from django.urls import reverse
 from django.contrib.sites.shortcuts import get_current_site
+from django.db import transaction
 from django.http import JsonResponse
 from django.utils import timezone
 from .forms import UserRegistrationForm, ProfileForm, ProfileUpdateForm
+from .backends import aget_request_profile
+from .decorators import login_required, referrer_prompt_exempt
+from .emails import notify_admins_of_registration, queue_verification_email
 from .models import Profile
+from .referrers import alookup_referrer, throttle
 from core.models import Referral
-from core.utils import build_referral_matrix
+from core.utils import build_referral_matrix, build_referral_tree, TREE_MAX_DEPTH, TREE_MAX_CHILDREN
 
 def landing_page(request):
     """Landing page view for unauthenticated users"""
@@ -28,59 +34,40 @@ def register(request):
         profile_form = ProfileForm(request.POST)
 
         if user_form.is_valid() and profile_form.is_valid():
-            # Create user
-            user = user_form.save(commit=False)
-            user.is_active = True  # Make email verification optional
-            user.save()
-
-            # Update profile with user-provided values, including unique phone override
-            profile = user.profile
-            profile_data = profile_form.cleaned_data
-            for field, value in profile_data.items():
-                setattr(profile, field, value)
-
-            # Set middle names from user form
-            if user_form.cleaned_data.get('middle_names'):
-                profile.middle_names = user_form.cleaned_data['middle_names']
-
-            # Auto-generate TAC Connector link
-            profile.tacconnector_link = profile.generate_tacconnector_link()
-
-            # Set terms agreement timestamp
-            if profile_data.get('agreed_to_terms'):
-                profile.terms_agreed_date = timezone.now()
-
-            profile.save()
-
-            # Create referral if referrer exists
-            if profile.referrer_phone:
-                try:
-                    referrer_profile = Profile.objects.get(phone=profile.referrer_phone)
-                    Referral.objects.create(referrer=referrer_profile, referred=profile)
-                except Profile.DoesNotExist:
-                    pass
-
-            # Send verification email
-            current_site = get_current_site(request)
-            verification_url = f"http://{current_site.domain}{reverse('verify_email', args=[str(profile.email_verification_token)])}"
-
-            try:
-                from .emails import send_verification_email
-                send_verification_email(user, verification_url)
-            except Exception:
-                pass
-
-            # Send admin notification (best-effort)
-            try:
-                send_mail(
-                    'New User Registration - WePool Tribe',
-                    f'A new user has registered: {user.get_full_name()} ({user.email})\nMember Type: {profile.get_member_type_display_ui()}\nPhone: {profile.phone}',
-                    DEFAULT_FROM_EMAIL,
-                    [getattr(settings, 'ADMIN_EMAIL', DEFAULT_FROM_EMAIL)],
-                    fail_silently=True,
-                )
-            except Exception:
-                pass
+            # One transaction, so a failed step leaves no half-registered member behind
+            with transaction.atomic():
+                # Create user
+                user = user_form.save(commit=False)
+                user.is_active = True  # Make email verification optional
+                user.save()
+
+                # Update profile with user-provided values, including unique phone override
+                profile = user.profile
+                profile_data = profile_form.cleaned_data
+                for field, value in profile_data.items():
+                    setattr(profile, field, value)
+
+                # Set middle names from user form
+                if user_form.cleaned_data.get('middle_names'):
+                    profile.middle_names = user_form.cleaned_data['middle_names']
+
+                # Auto-generate TAC Connector link
+                profile.tacconnector_link = profile.generate_tacconnector_link()
+
+                # Set terms agreement timestamp
+                if profile_data.get('agreed_to_terms'):
+                    profile.terms_agreed_date = timezone.now()
+
+                # Resolves referrer_phone and links the Referral (see core.models.move_referral)
+                profile.save()
+
+                # Send verification email
+                current_site = get_current_site(request)
+                verification_url = f"http://{current_site.domain}{reverse('verify_email', args=[str(profile.email_verification_token)])}"
+
+                # Both only insert outbox rows; a failure here is a database error, not SMTP
+                queue_verification_email(user, verification_url)
+                notify_admins_of_registration(user, profile)
 
             messages.success(request, 'Registration successful! Please check your email to verify your account.')
             return redirect('login')
@@ -93,17 +80,16 @@ def register(request):
         'profile_form': profile_form
     })
 
+@referrer_prompt_exempt
 def verify_email(request, token):
     try:
         profile = Profile.objects.get(email_verification_token=token)
         profile.verified_email = True
         profile.user.is_active = True
         profile.user.save()
+        # Saving the verified flag re-evaluates Yellow qualification (see users.models)
         profile.save()
 
-        # Check Yellow qualification
-        profile.check_yellow_qualification()
-
         messages.success(request, 'Email verified successfully! You can now log in.')
         return redirect('login')
     except Profile.DoesNotExist:
@@ -122,6 +108,7 @@ def user_dashboard(request):
         'direct_referrals': direct_referrals
     })
 
+@referrer_prompt_exempt
 @login_required
 def update_profile(request):
     profile = request.user.profile
@@ -151,10 +138,9 @@ def update_techconnect_status(request):
         profile.registered_tacconnector = registered  # Updated field name
         if tacconnector_link:
             profile.tacconnector_link = tacconnector_link  # Updated field name
+        # Saving the TAC Connector fields re-evaluates Yellow qualification (see users.models)
         profile.save()
-
-        # Check if now qualifies for yellow status
-        qualified = profile.check_yellow_qualification()
+        qualified = profile.status == 'yellow'
 
         return JsonResponse({
             'success': True,
@@ -165,40 +151,50 @@ def update_techconnect_status(request):
     return JsonResponse({'success': False})
 
 @login_required
-def referral_tree_data(request):
+async def referral_tree_data(request):
     """Get referral tree data for visualization"""
-    profile = request.user.profile
-
-    def build_tree_node(profile):
-        referrals = Referral.objects.filter(referrer=profile).select_related('referred__user')
-        return {
-            'name': profile.user.get_full_name(),
-            'phone': profile.phone,
-            'status': profile.status,
-            'member_type': profile.member_type,
-            'children': [build_tree_node(ref.referred) for ref in referrals[:10]]
-        }
-
-    tree_data = build_tree_node(profile)
+    profile = await aget_request_profile(request)
+
+    max_depth = _bounded_int(
+        request.GET.get('depth'), TREE_MAX_DEPTH,
+        getattr(settings, 'REFERRAL_TREE_MAX_DEPTH', 8)
+    )
+    max_children = _bounded_int(
+        request.GET.get('children'), TREE_MAX_CHILDREN,
+        getattr(settings, 'REFERRAL_TREE_MAX_CHILDREN', 50)
+    )
+
+    # The tree is one raw recursive query (or a level-by-level walk); run it in a worker thread
+    tree_data = await sync_to_async(build_referral_tree)(profile, max_depth=max_depth, max_children=max_children)
     return JsonResponse(tree_data)
 
-def check_referrer_exists(request):
-    """AJAX endpoint to check if referrer phone exists"""
-    phone = request.GET.get('phone', '')
+def _bounded_int(value, default, maximum):
+    """Parse a positive integer query parameter, clamped to maximum"""
+    try:
+        return max(1, min(int(value), maximum))
+    except (TypeError, ValueError):
+        return default
 
-    if phone:
-        exists = Profile.objects.filter(phone=phone).exists()
-        if exists:
-            referrer = Profile.objects.get(phone=phone)
-            return JsonResponse({
-                'exists': True,
-                'name': referrer.user.get_full_name(),
-                'member_type': referrer.member_type
-            })
+async def check_referrer_exists(request):
+    """AJAX endpoint to check if referrer phone exists"""
+    wait = throttle(request)
+    if wait:
+        response = JsonResponse({'exists': False, 'throttled': True}, status=429)
+        response['Retry-After'] = str(math.ceil(wait))
+        return response
+
+    referrer = await alookup_referrer(request.GET.get('phone', ''))
+    if referrer:
+        return JsonResponse({
+            'exists': True,
+            'name': referrer['name'],
+            'member_type': referrer['member_type']
+        })
 
     return JsonResponse({'exists': False})
 
 # users/views.py - Update the verify_email function (continued)
+@referrer_prompt_exempt
 def verify_email(request, token):
     try:
         profile = Profile.objects.get(email_verification_token=token)
@@ -207,11 +203,9 @@ def verify_email(request, token):
         profile.verified_email = True
         profile.user.is_active = True
         profile.user.save()
+        # Saving the verified flag re-evaluates Yellow qualification (see users.models)
         profile.save()
 
-        # Check Yellow qualification
-        profile.check_yellow_qualification()
-
         messages.success(request, 'Email verified successfully! You can now log in.')
         return redirect('login')
     except Profile.DoesNotExist:
@@ -250,5 +244,6 @@ def debug_login(request):
     except User.DoesNotExist:
         return JsonResponse({'error': 'User does not exist', 'user_exists': False})
 
+@referrer_prompt_exempt
 def email_lock(request):
     return render(request, 'users/email_lock.html')
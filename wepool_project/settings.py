@@ -100,6 +100,12 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# ProfileBackend loads the member profile with request.user; ModelBackend stays for existing sessions
+AUTHENTICATION_BACKENDS = [
+    'users.backends.ProfileBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
 USE_I18N = True
@@ -131,6 +137,13 @@ EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@wepooltribe.com')
 
+# New-registration emails to ADMIN_EMAIL: 'instant' (one per registration) or
+# 'digest' (one summary per ADMIN_DIGEST_WINDOW minutes, see send_admin_digest)
+ADMIN_NOTIFICATION_MODE = os.environ.get('ADMIN_NOTIFICATION_MODE', 'instant')
+ADMIN_DIGEST_WINDOW = int(os.environ.get('ADMIN_DIGEST_WINDOW', '60'))
+# Base URL for links in emails sent outside a request
+SITE_URL = os.environ.get('SITE_URL', 'http://localhost:8000')
+
 # Authentication
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'user_dashboard'
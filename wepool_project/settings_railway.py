@@ -212,11 +212,16 @@ LOGGING = {
     },
 }
 
-# Cache configuration for Railway (using database)
+# Cache configuration for Railway: per-process LRU in front of Redis (REDIS_URL),
+# falling back to a file-based cache shared by the workers in the container
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
-        'LOCATION': 'cache_table',
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': os.environ.get('REDIS_URL') or os.environ.get('CACHE_DIR', '/tmp/wepool_cache'),
+        'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': int(os.environ.get('CACHE_LOCAL_MAX_ENTRIES', 1000)),
+            'LOCAL_TIMEOUT': 30,
+        },
     }
 }
 
@@ -224,6 +229,12 @@ CACHES = {
 SESSION_COOKIE_AGE = 3600  # 1 hour
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 SESSION_SAVE_EVERY_REQUEST = True
+# Cached sessions that rewrite the row only when changed or every SESSION_REFRESH_INTERVAL seconds
+SESSION_ENGINE = 'core.sessions'
+SESSION_REFRESH_INTERVAL = 300
+
+# One reverse proxy (nginx / the Railway edge) appends the client address to X-Forwarded-For
+TRUSTED_PROXY_COUNT = 1
 
 # Security middleware for Railway
 SECURE_REFERRER_POLICY = 'strict-origin-when-cross-origin'